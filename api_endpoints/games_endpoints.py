@@ -2,6 +2,7 @@ import endpoints
 from protorpc import remote, messages
 from utils import get_by_urlsafe
 from hangman_api import HangmanAPI
+from instrumentation import instrumented
 
 from models.game_model import (
     Game,
@@ -12,6 +13,10 @@ from models.game_model import (
     GuessWordForm,
     GameHistoryForm,
     GameHistoryForms,
+    BatchGuessForm,
+    BatchGuessResultForm,
+    GameKeysForm,
+    HintForm,
 )
 
 import controllers.games_controller as games_ctrl
@@ -21,17 +26,28 @@ import controllers.games_controller as games_ctrl
 GET_GAME_REQUEST     = endpoints.ResourceContainer(
     urlsafe_game_key=messages.StringField(1))
 
+GET_GAME_HISTORY_REQUEST = endpoints.ResourceContainer(
+    urlsafe_game_key=messages.StringField(1),
+    if_none_match=messages.StringField(2, required=False))
+
 GUESS_LETTER_REQUEST = endpoints.ResourceContainer(
     GuessLetterForm, urlsafe_game_key=messages.StringField(1))
 
 GUESS_WORD_REQUEST = endpoints.ResourceContainer(
     GuessWordForm, urlsafe_game_key=messages.StringField(1))
 
+BATCH_GUESS_REQUEST = endpoints.ResourceContainer(
+    BatchGuessForm, urlsafe_game_key=messages.StringField(1))
+
 GET_USER_GAMES_REQUEST = endpoints.ResourceContainer(
-    user_name=messages.StringField(1))
+    user_name=messages.StringField(1),
+    page_size=messages.IntegerField(2, required=False),
+    cursor=messages.StringField(3, required=False))
 
 CREATE_GAME_REQUEST = endpoints.ResourceContainer(CreateGameForm)
 
+GET_GAMES_REQUEST = endpoints.ResourceContainer(GameKeysForm)
+
 @HangmanAPI.api_class(resource_name='games')
 class GamesEndpoints(remote.Service):
 
@@ -40,10 +56,13 @@ class GamesEndpoints(remote.Service):
                       path='games',
                       name='create_game',
                       http_method='POST')
+    @instrumented
     def create_game(self, request):
         """Create a game"""
         return games_ctrl.create_game(user_name=request.user_name,
-                                      misses_allowed=request.misses_allowed)
+                                      misses_allowed=request.misses_allowed,
+                                      word_length=request.word_length,
+                                      difficulty=request.difficulty)
 
 
     @endpoints.method(request_message=GET_GAME_REQUEST,
@@ -51,16 +70,29 @@ class GamesEndpoints(remote.Service):
                       path='games/{urlsafe_game_key}',
                       name='get_game',
                       http_method='GET')
+    @instrumented
     def get_game(self, request):
         """Return a game state"""
         return games_ctrl.get_game(request.urlsafe_game_key)
 
 
+    @endpoints.method(request_message=GET_GAMES_REQUEST,
+                      response_message=GameStateForms,
+                      path='games/batch',
+                      name='get_games',
+                      http_method='POST')
+    @instrumented
+    def get_games(self, request):
+        """Return the state of several games"""
+        return games_ctrl.get_games(request.urlsafe_game_keys)
+
+
     @endpoints.method(request_message=GUESS_LETTER_REQUEST,
                       response_message=GameStateForm,
                       path='games/{urlsafe_game_key}/guess/letter',
                       name='guess_letter',
                       http_method='PUT')
+    @instrumented
     def guess_letter(self, request):
         """Guess a letter in a game. Returns the state of the game"""
         return games_ctrl.guess_letter(request.urlsafe_game_key,
@@ -72,20 +104,46 @@ class GamesEndpoints(remote.Service):
                       path='games/{urlsafe_game_key}/guess/word',
                       name='guess_word',
                       http_method='PUT')
+    @instrumented
     def guess_word(self, request):
         """Guess the secret word in a game"""
         return games_ctrl.guess_word(request.urlsafe_game_key,
                                      request.word_guess)
 
 
+    @endpoints.method(request_message=BATCH_GUESS_REQUEST,
+                      response_message=BatchGuessResultForm,
+                      path='games/{urlsafe_game_key}/guess/batch',
+                      name='batch_guess',
+                      http_method='PUT')
+    @instrumented
+    def batch_guess(self, request):
+        """Make several letter and word guesses in a game at once"""
+        return games_ctrl.batch_guess(request.urlsafe_game_key,
+                                      request.guesses)
+
+
     @endpoints.method(request_message=GET_GAME_REQUEST,
+                      response_message=HintForm,
+                      path='games/{urlsafe_game_key}/hint',
+                      name='get_hint',
+                      http_method='PUT')
+    @instrumented
+    def get_hint(self, request):
+        """Suggest the next letter to guess, at a score penalty"""
+        return games_ctrl.get_hint(request.urlsafe_game_key)
+
+
+    @endpoints.method(request_message=GET_GAME_HISTORY_REQUEST,
                       response_message=GameHistoryForms,
                       path='games/{urlsafe_game_key}/history',
                       name='get_game_history',
                       http_method='GET')
+    @instrumented
     def get_game_history(self, request):
         """Get the history of a game"""
-        return games_ctrl.get_game_history(request.urlsafe_game_key)
+        return games_ctrl.get_game_history(request.urlsafe_game_key,
+                                           request.if_none_match)
 
 
     @endpoints.method(request_message=GET_USER_GAMES_REQUEST,
@@ -93,9 +151,12 @@ class GamesEndpoints(remote.Service):
                       path='games/user/{user_name}',
                       name='get_user_games',
                       http_method='GET')
+    @instrumented
     def get_user_games(self, request):
-        """Return all games of a user"""
-        return games_ctrl.get_user_games(request.user_name)
+        """Return a page of the active games of a user"""
+        return games_ctrl.get_user_games(request.user_name,
+                                         request.page_size,
+                                         request.cursor)
 
 
     @endpoints.method(request_message=GET_GAME_REQUEST,
@@ -103,6 +164,7 @@ class GamesEndpoints(remote.Service):
                       path='games/{urlsafe_game_key}/cancel',
                       name='cancel_game',
                       http_method='PUT')
+    @instrumented
     def cancel_game(self, request):
         """Cancel a game"""
         return games_ctrl.cancel_game(request.urlsafe_game_key)
@@ -1,6 +1,7 @@
 import endpoints
 from protorpc import remote, messages
 from hangman_api import HangmanAPI
+from instrumentation import instrumented
 
 import controllers.scores_controller as scores_ctrl
 from models.score_model import (
@@ -12,38 +13,64 @@ from models.score_model import (
 ######### RESOURCE CONTAINERS ##########
 
 USER_SCORE_REQUEST   = endpoints.ResourceContainer(
-    user_name=messages.StringField(1))
+    user_name=messages.StringField(1),
+    page_size=messages.IntegerField(2, required=False),
+    cursor=messages.StringField(3, required=False),
+    if_none_match=messages.StringField(4, required=False))
 
 GET_SCORES_REQUEST = endpoints.ResourceContainer(
-    number_of_results=messages.StringField(1, required=False))
+    page_size=messages.IntegerField(1, required=False),
+    cursor=messages.StringField(2, required=False),
+    if_none_match=messages.StringField(3, required=False))
+
+GET_HIGH_SCORES_REQUEST = endpoints.ResourceContainer(
+    number_of_results=messages.StringField(1, required=False),
+    page_size=messages.IntegerField(2, required=False),
+    cursor=messages.StringField(3, required=False),
+    if_none_match=messages.StringField(4, required=False),
+    period=messages.StringField(5, required=False),
+    date=messages.StringField(6, required=False))
 
 
 @HangmanAPI.api_class(resource_name='scores')
 class ScoresEndpoints(remote.Service):
 
-    @endpoints.method(response_message=ScoreForms,
+    @endpoints.method(request_message=GET_SCORES_REQUEST,
+                      response_message=ScoreForms,
                       path='scores',
                       name='get_scores',
                       http_method='GET')
+    @instrumented
     def get_scores(self, request):
-        """Return all scores"""
-        return scores_ctrl.get_scores()
+        """Return a page of all scores"""
+        return scores_ctrl.get_scores(request.page_size, request.cursor,
+                                      request.if_none_match)
 
     @endpoints.method(request_message=USER_SCORE_REQUEST,
                       response_message=ScoreForms,
                       path='scores/user/{user_name}',
                       name='get_user_scores',
                       http_method='GET')
+    @instrumented
     def get_user_scores(self, request):
-        """Return all scores of a user"""
-        return scores_ctrl.get_user_scores(request.user_name)
+        """Return a page of the scores of a user"""
+        return scores_ctrl.get_user_scores(request.user_name,
+                                           request.page_size,
+                                           request.cursor,
+                                           request.if_none_match)
 
 
-    @endpoints.method(request_message=GET_SCORES_REQUEST,
+    @endpoints.method(request_message=GET_HIGH_SCORES_REQUEST,
                       response_message=ScoreForms,
                       path='scores/high',
                       name='get_high_scores',
                       http_method='GET')
+    @instrumented
     def get_high_scores(self, request):
-        """Returns a list of high scores"""
-        return scores_ctrl.get_high_scores(request.number_of_results)
+        """Returns a list of all time, daily or weekly high scores"""
+        return scores_ctrl.get_high_scores(request.number_of_results,
+                                           request.page_size,
+                                           request.cursor,
+                                           request.if_none_match,
+                                           request.period,
+                                           request.date)
@@ -1,6 +1,7 @@
 import endpoints
-from protorpc import remote
+from protorpc import remote, messages
 from hangman_api import HangmanAPI
+from instrumentation import instrumented
 
 from models.user_model import (
     RankingForm,
@@ -8,10 +9,19 @@ from models.user_model import (
     UserMessage,
     CreateUserForm
 )
+from models.stats_model import UserStatsForm
 import controllers.users_controller as users_ctrl
 
 CREATE_USER_REQUEST = endpoints.ResourceContainer(CreateUserForm)
 
+GET_USER_STATS_REQUEST = endpoints.ResourceContainer(
+    user_name=messages.StringField(1))
+
+GET_RANKINGS_REQUEST = endpoints.ResourceContainer(
+    page_size=messages.IntegerField(1, required=False),
+    cursor=messages.StringField(2, required=False),
+    if_none_match=messages.StringField(3, required=False))
+
 
 # API Endpoints
 @HangmanAPI.api_class(resource_name='users')
@@ -22,15 +32,32 @@ class UsersEndpoints(remote.Service):
                       path = 'users',
                       name = 'create_user',
                       http_method = 'POST')
+    @instrumented
     def create_user(self, request):
         """Create a user"""
         return users_ctrl.create_user(request.user_name, request.email)
 
 
-    @endpoints.method(response_message=RankingForms,
+    @endpoints.method(request_message=GET_RANKINGS_REQUEST,
+                      response_message=RankingForms,
                       path='users/ranking',
                       name='get_user_rankings',
                       http_method='GET')
+    @instrumented
     def get_user_rankings(self, request):
         """Returns a list of users with the highest scores"""
-        return users_ctrl.get_user_rankings()
+        return users_ctrl.get_user_rankings(request.page_size,
+                                            request.cursor,
+                                            request.if_none_match)
+
+
+    @endpoints.method(request_message=GET_USER_STATS_REQUEST,
+                      response_message=UserStatsForm,
+                      path='users/{user_name}/stats',
+                      name='get_user_stats',
+                      http_method='GET')
+    @instrumented
+    def get_user_stats(self, request):
+        """Returns a user's win rate, games played and average score and
+        guesses per game"""
+        return users_ctrl.get_user_stats(request.user_name)
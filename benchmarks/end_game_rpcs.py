@@ -0,0 +1,57 @@
+"""end_game_rpcs.py - RPCs and latency of the winning move of a game.
+
+Plays games on the SDK testbed up to their last letter, then counts the API
+calls made by the winning guess_letter call and times it. Run it on two
+commits to compare them:
+    GAE_SDK=/path/to/google_appengine python -m benchmarks.end_game_rpcs
+"""
+
+import time
+
+from benchmarks.sdk import setup_sdk, start_testbed, RpcCounter
+
+setup_sdk()
+
+from google.appengine.ext import ndb
+
+import controllers.games_controller as games_ctrl
+from models.user_model import User
+from models.game_model import Game
+
+GAMES = 50
+WORD = 'FROG'
+
+
+def main():
+    bed = start_testbed()
+    try:
+        user = User.create(user_name='bench', email='')
+        calls = {}
+        seconds = 0.0
+        counter = RpcCounter()
+        for _ in range(GAMES):
+            game = Game.create_game(user=user.key, misses_allowed=5,
+                                    secret_word=WORD,
+                                    current_solution='_' * len(WORD))
+            urlsafe = game.key.urlsafe()
+            for letter in WORD[:-1]:
+                games_ctrl.guess_letter(urlsafe, letter)
+            ndb.get_context().clear_cache()
+
+            with counter:
+                start = time.time()
+                games_ctrl.guess_letter(urlsafe, WORD[-1])
+                seconds += time.time() - start
+            for name, count in counter.calls.items():
+                calls[name] = calls.get(name, 0) + count
+
+        print('winning move: {:.1f} RPCs, {:.2f} ms'.format(
+            sum(calls.values()) / float(GAMES), seconds / GAMES * 1000))
+        for name in sorted(calls):
+            print('  {:32} {:.1f}'.format(name, calls[name] / float(GAMES)))
+    finally:
+        bed.deactivate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""engine_guesses.py - Micro-benchmark of letter guess evaluation.
+
+Compares the string based evaluation games_controller used to do, checking
+membership, counting and rebuilding the current solution from lists, with
+the position index and revealed mask of game_engine. Each game guesses
+letters in a random order until it is solved, for short words and for long
+dictionary words. Runs without the SDK:
+    python -m benchmarks.engine_guesses
+
+On Python 2.7 the engine took about 15us per game on long words against
+26us for the strings, and was within 10% of them on short words, where a
+guess reveals one or two positions and the call overhead dominates.
+"""
+
+import random
+import string
+import timeit
+
+import game_engine
+
+SHORT_WORDS = ['APPLE', 'TREE', 'HOUSE', 'GARDEN', 'SPECIAL', 'FROG',
+               'CHILDREN', 'FOOD', 'SERVICE', 'COMPUTER']
+LONG_WORDS = ['INTERNATIONALIZATION', 'COUNTERREVOLUTIONARIES',
+              'UNCHARACTERISTICALLY', 'ELECTROENCEPHALOGRAPH',
+              'MICROARCHITECTURES', 'DISPROPORTIONATENESS']
+GAMES = 100
+REPEAT = 50
+
+
+def play_strings(word, letters):
+    """Guess letters the way the controller used to"""
+    solution = '_' * len(word)
+    guessed = ''
+    for letter in letters:
+        if guessed and letter in guessed:
+            continue
+        guessed += letter
+        if letter in word:
+            word.count(letter)
+            matches = [i for i, x in enumerate(list(word)) if x == letter]
+            current = list(solution)
+            for match in matches:
+                current[match] = letter
+            solution = ''.join(current)
+            if solution == word:
+                return
+
+
+def play_engine(word, letters):
+    """Guess letters with game_engine, filling in the solution as the
+    controller does after a correct guess"""
+    mask = 0
+    solution = '_' * len(word)
+    guessed = 0
+    for letter in letters:
+        bit = 1 << (ord(letter) - ord('A'))
+        if guessed & bit:
+            continue
+        guessed |= bit
+        mask, solution, count = game_engine.apply_letter(word, mask,
+                                                         solution, letter)
+        if count and game_engine.is_solved(word, mask):
+            return
+
+
+def main():
+    rng = random.Random(0)
+    for label, words in [('short', SHORT_WORDS), ('long', LONG_WORDS)]:
+        games = []
+        for _ in range(GAMES):
+            letters = list(string.ascii_uppercase)
+            rng.shuffle(letters)
+            games.append((rng.choice(words), letters))
+
+        for name, play in [('strings', play_strings),
+                           ('engine', play_engine)]:
+            def run():
+                for word, letters in games:
+                    play(word, letters)
+            seconds = timeit.timeit(run, number=REPEAT)
+            print('{:6} words {:8} {:7.2f} us per game'.format(
+                label, name, seconds / REPEAT / GAMES * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""hint_latency.py - Latency of hints from the pattern index.
+
+Builds a synthetic dictionary, plays random games by guessing letters in
+order of English frequency, and times a hint at every step: the first hint
+of a word length (which builds that length's index), hints for new states,
+and hints for states already memoized. A plain scan of the words of the same
+length is timed for comparison. Runs without the SDK:
+    python -m benchmarks.hint_latency [number_of_words]
+"""
+
+import random
+import re
+import string
+import sys
+import time
+
+from hint_engine import HintIndex
+from word_source import WordSource
+
+DEFAULT_WORDS = 200000
+GAMES = 200
+LETTER_ORDER = 'ETAOINSHRDLUCMFWYPVBGKJQXZ'
+
+
+def synthetic_words(count):
+    """Returns a newline separated string of random words of 4 to 12
+    letters, drawn with English letter frequencies"""
+    rng = random.Random(0)
+    weights = ''.join(letter * (26 - rank)
+                      for rank, letter in enumerate(LETTER_ORDER))
+    return '\n'.join(''.join(rng.choice(weights)
+                             for _ in range(rng.randint(4, 12)))
+                     for _ in range(count))
+
+
+def game_states(source, rng):
+    """Returns the (pattern, guessed letters) states of random games"""
+    states = []
+    for _ in range(GAMES):
+        word = source.choose()
+        guessed = list(LETTER_ORDER[:rng.randint(0, 8)])
+        pattern = ''.join(letter if letter in guessed else '_'
+                          for letter in word)
+        states.append((pattern, guessed))
+    return states
+
+
+def scan_hint(words, pattern, guessed):
+    """Returns the best letter by scanning every word of the length"""
+    wrong = set(guessed) - set(pattern)
+    blank = '[^{}]'.format(''.join(set(pattern) - set('_')) or '_')
+    matcher = re.compile(pattern.replace('_', blank) + '$')
+    counts = dict((letter, 0) for letter in string.ascii_uppercase
+                  if letter not in guessed)
+    for word in words:
+        if matcher.match(word) and not wrong.intersection(word):
+            for letter in set(word):
+                if letter in counts:
+                    counts[letter] += 1
+    return max(sorted(counts), key=counts.get)
+
+
+def timed(calls):
+    """Returns the median and maximum milliseconds of a list of calls"""
+    times = []
+    for call in calls:
+        start = time.time()
+        call()
+        times.append((time.time() - start) * 1000)
+    times.sort()
+    return times[len(times) // 2], times[-1]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_WORDS
+    source = WordSource.build(synthetic_words(count))
+    states = game_states(source, random.Random(1))
+    index = HintIndex(source)
+
+    start = time.time()
+    for length in sorted(set(len(pattern) for pattern, _ in states)):
+        index.length_index(length)
+    print('index build   {:8.1f} ms for all lengths'.format(
+        (time.time() - start) * 1000))
+
+    print('new state     median {:6.2f} ms  max {:6.2f} ms'.format(*timed(
+        [lambda p=p, g=g: index.suggest(p, g) for p, g in states])))
+    print('memoized      median {:6.2f} ms  max {:6.2f} ms'.format(*timed(
+        [lambda p=p, g=g: index.suggest(p, g) for p, g in states])))
+
+    words = {}
+    for number in range(len(source)):
+        word = source.word(number)
+        words.setdefault(len(word), []).append(word)
+    print('plain scan    median {:6.2f} ms  max {:6.2f} ms'.format(*timed(
+        [lambda p=p, g=g: scan_hint(words[len(p)], p, g)
+         for p, g in states[:20]])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""history_encoding.py - Compare the old and compact Game history formats.
+
+Plays the same sequence of moves into a Game using the old JSON history and
+letters_guessed string, and into one using history_data and letters_mask.
+Reports the serialized entity size and the CPU time per move, which is
+dominated by re-serializing the entity for each put.
+"""
+
+import json
+import timeit
+
+from benchmarks.sdk import setup_sdk, start_testbed
+
+setup_sdk()
+
+from google.appengine.ext import ndb
+
+from models.game_model import Game
+
+MOVES = [('E', 'Correct'), ('T', 'Incorrect'), ('A', 'Correct'),
+         ('O', 'Incorrect'), ('I', 'Correct'), ('N', 'Incorrect'),
+         ('S', 'Correct'), ('R', 'Correct'), ('H', 'Incorrect'),
+         ('SERVICE', 'Correct'), ('', 'Game Won')]
+REPEAT = 2000
+
+
+def new_game():
+    """Returns an unsaved game"""
+    user = ndb.Key('User', 1)
+    return Game(key=ndb.Key('Game', 1, parent=user), user=user,
+                misses_allowed=5, misses_remaining=5,
+                secret_word='SERVICE', current_solution='_______')
+
+
+def play_old():
+    """Play the moves in the old format, returns the final entity size"""
+    game = new_game()
+    for guess, result in MOVES:
+        if len(guess) == 1:
+            game.letters_guessed += guess
+        game.history.append(json.dumps({'guess': guess, 'result': result}))
+        size = len(ndb.model_to_protobuf(game).Encode())
+    return size
+
+
+def play_compact():
+    """Play the moves in the compact format, returns the final entity size"""
+    game = new_game()
+    for guess, result in MOVES:
+        if len(guess) == 1:
+            game.update_letters_guessed(guess)
+        game.update_history(guess, result)
+        size = len(ndb.model_to_protobuf(game).Encode())
+    return size
+
+
+def main():
+    bed = start_testbed()
+    try:
+        for name, play in [('old', play_old), ('compact', play_compact)]:
+            size = play()
+            seconds = timeit.timeit(play, number=REPEAT)
+            per_move = seconds / REPEAT / len(MOVES) * 1e6
+            print('{:8} entity size {:5} bytes, {:7.1f} us per move'.format(
+                name, size, per_move))
+
+        game = new_game()
+        for guess, result in MOVES:
+            game.update_history(guess, result)
+        seconds = timeit.timeit(game.create_history_form, number=REPEAT)
+        print('compact history decode {:.1f} us'.format(
+            seconds / REPEAT * 1e6))
+    finally:
+        bed.deactivate()
+
+
+if __name__ == '__main__':
+    main()
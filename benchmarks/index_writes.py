@@ -0,0 +1,131 @@
+"""index_writes.py - Datastore write operations per guess, before and after
+the Game properties that are never queried were unindexed.
+
+Plays a game through the rules engine and counts the index rows that each
+put of the Game changes. Write operations are then estimated with the
+datastore's per-operation pricing. A new entity costs 2 writes, plus 2 per
+indexed property value and 1 per composite index row. An update costs 1
+write, plus 2 per built-in index row and 1 per composite index row that
+changed, since a changed value deletes one row and writes another. The
+before numbers use the same models with the now unindexed properties marked
+indexed again, and the composite indexes of the time:
+    GAE_SDK=/path/to/google_appengine python -m benchmarks.index_writes
+"""
+
+import itertools
+
+from benchmarks.sdk import setup_sdk, start_testbed
+
+setup_sdk()
+
+from google.appengine.ext import ndb
+
+import game_engine
+from models.game_model import Game
+from models.user_model import User
+
+WORD = 'SERVICE'
+GUESSES = ['E', 'T', 'I', 'A', 'S', 'R', 'V', 'SERVICE']
+
+# Properties that were indexed before this change
+BEFORE_INDEXED = {
+    Game: ('misses_allowed', 'misses_remaining', 'letters_guessed',
+           'letters_mask', 'game_over', 'game_cancelled', 'secret_word',
+           'current_solution', 'revealed_mask', 'score', 'version'),
+    User: ('score',),
+}
+
+# Composite indexes as (ancestor, properties), see index.yaml
+BEFORE_COMPOSITES = ((True, ('game_over',)),
+                     (False, ('user', 'game_cancelled', 'game_over')))
+AFTER_COMPOSITES = ((True, ('status',)),
+                    (False, ('user', 'status')))
+USER_COMPOSITES = ((False, ('ranking_score', 'user_name')),)
+
+AFTER_INDEXED = dict(((model, name), model._properties[name]._indexed)
+                     for model, names in BEFORE_INDEXED.items()
+                     for name in names)
+
+
+def set_indexing(before):
+    """Mark properties indexed as they were before this change, or as
+    they are now"""
+    for (model, name), indexed in AFTER_INDEXED.items():
+        model._properties[name]._indexed = before or indexed
+    # status didn't exist before
+    Game._properties['status']._indexed = not before
+
+
+def index_rows(entity, composites):
+    """Returns the sets of built-in and composite index rows of an entity"""
+    values = {}
+    for prop in ndb.model_to_protobuf(entity).property_list():
+        values.setdefault(prop.name(), []).append(prop.value().Encode())
+    rows = set((name, value)
+               for name, found in values.items() for value in found)
+    composite_rows = set()
+    for ancestor, names in composites:
+        if all(name in values for name in names):
+            composite_rows.update(
+                (ancestor, names, combination)
+                for combination in itertools.product(
+                    *[values[name] for name in names]))
+    return rows, composite_rows
+
+
+def write_ops(previous, current):
+    """Returns the write operations of a put, previous is None for a new
+    entity"""
+    rows, composite_rows = current
+    if previous is None:
+        return 2 + 2 * len(rows) + len(composite_rows)
+    return (1 + 2 * len(previous[0] ^ rows) +
+            len(previous[1] ^ composite_rows))
+
+
+def play(composites):
+    """Returns the write operations of creating a game and of each of its
+    guesses"""
+    user = ndb.Key('User', 'bench')
+    game = Game(key=ndb.Key('Game', 1, parent=user), user=user,
+                misses_allowed=5, misses_remaining=5, secret_word=WORD,
+                current_solution='_' * len(WORD), revealed_mask=0)
+    rows = index_rows(game, composites)
+    ops = [write_ops(None, rows)]
+    for guess in GUESSES:
+        state = game.engine_state()
+        if len(guess) == 1:
+            game_engine.guess_letter(state, guess)
+        else:
+            game_engine.guess_word(state, guess)
+        game.apply_engine_state(state)
+        game.version += 1
+        previous, rows = rows, index_rows(game, composites)
+        ops.append(write_ops(previous, rows))
+    return ops
+
+
+def main():
+    bed = start_testbed()
+    try:
+        user = User(key=ndb.Key('User', 'bench'), user_name='bench',
+                    email='bench@example.com', score=0, ranking_score=0)
+        for label, before, composites in [
+                ('before', True, BEFORE_COMPOSITES),
+                ('after', False, AFTER_COMPOSITES)]:
+            set_indexing(before)
+            ops = play(composites)
+            guesses = ops[1:]
+            print('{:6} create user {:3}  create game {:3}  per guess {:5.1f}'
+                  '  (guesses {})'.format(
+                      label,
+                      write_ops(None, index_rows(user, USER_COMPOSITES)),
+                      ops[0], float(sum(guesses)) / len(guesses),
+                      ' '.join(str(n) for n in guesses)))
+    finally:
+        set_indexing(False)
+        bed.deactivate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""listing_reads.py - Datastore reads of the listing endpoints, with and
+without projection queries.
+
+Seeds users and scores on the SDK testbed, then pages through the score
+listings and the user rankings query with LIGHTWEIGHT_LISTINGS off and on.
+For each it reports the entities returned, the bytes of the query responses,
+the API calls and the time per page. memcache is flushed before each page so
+every page runs its query instead of coming from response_cache:
+    GAE_SDK=/path/to/google_appengine python -m benchmarks.listing_reads
+"""
+
+import random
+import time
+from datetime import date
+
+from benchmarks.sdk import setup_sdk, start_testbed, RpcCounter
+
+setup_sdk()
+
+from google.appengine.api import apiproxy_stub_map, memcache
+from google.appengine.ext import ndb
+
+import controllers.scores_controller as scores_ctrl
+import controllers.users_controller as users_ctrl
+from models.user_model import User
+from models.score_model import Score
+
+USERS = 200
+SCORES_PER_USER = 20
+PAGE_SIZE = 100
+PAGES = 10
+
+
+class ResponseBytes(object):
+    """Totals the size of the datastore query responses"""
+
+    def __init__(self):
+        self.total = 0
+        apiproxy_stub_map.apiproxy.GetPostCallHooks().Append(
+            'response_bytes', self._hook)
+
+    def _hook(self, service, call, request, response):
+        if service == 'datastore_v3' and call in ('RunQuery', 'Next'):
+            self.total += response.ByteSize()
+
+
+def seed():
+    """Create users with a ranking score and finished games"""
+    for number in range(USERS):
+        user = User.create(user_name='user{}'.format(number), email='')
+        user.ranking_score = random.randint(0, 5000)
+        user.put()
+        ndb.put_multi([Score(user=user.key, user_name=user.user_name,
+                             date=date.today(), won=random.random() < 0.5,
+                             score=random.randint(0, 200))
+                       for _ in range(SCORES_PER_USER)])
+    # Give get_high_scores and get_user_rankings a cursor, so they query
+    # instead of reading the (unbuilt) leaderboards
+    return (scores_ctrl.get_high_scores(None, 1).next_cursor,
+            users_ctrl.get_user_rankings(1).next_cursor)
+
+
+def listings(high_scores_cursor, rankings_cursor):
+    """Returns a dict of listing name to a function fetching a page"""
+    return {
+        'get_scores': lambda: scores_ctrl.get_scores(PAGE_SIZE),
+        'get_user_scores': lambda: scores_ctrl.get_user_scores(
+            'user{}'.format(random.randrange(USERS)), PAGE_SIZE),
+        'get_high_scores': lambda: scores_ctrl.get_high_scores(
+            None, PAGE_SIZE, high_scores_cursor),
+        'get_user_rankings': lambda: users_ctrl.get_user_rankings(
+            PAGE_SIZE, rankings_cursor),
+    }
+
+
+def main():
+    bed = start_testbed()
+    try:
+        pages = listings(*seed())
+        counter = RpcCounter()
+        response_bytes = ResponseBytes()
+        for lightweight in (False, True):
+            scores_ctrl.LIGHTWEIGHT_LISTINGS = lightweight
+            users_ctrl.LIGHTWEIGHT_LISTINGS = lightweight
+            print('LIGHTWEIGHT_LISTINGS = {}'.format(lightweight))
+            for name in sorted(pages):
+                items = rpcs = seconds = 0
+                response_bytes.total = 0
+                for _ in range(PAGES):
+                    # The listings are served from response_cache, so every
+                    # page would otherwise be a memcache hit after the first
+                    memcache.flush_all()
+                    ndb.get_context().clear_cache()
+                    with counter:
+                        start = time.time()
+                        items += len(pages[name]().items)
+                        seconds += time.time() - start
+                    rpcs += counter.total()
+                print('  {:18} {:5.0f} items {:8.0f} bytes {:5.1f} RPCs '
+                      '{:7.2f} ms per page'.format(
+                          name, items / float(PAGES),
+                          response_bytes.total / float(PAGES),
+                          rpcs / float(PAGES), seconds / PAGES * 1000))
+    finally:
+        bed.deactivate()
+
+
+if __name__ == '__main__':
+    main()
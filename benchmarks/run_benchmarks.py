@@ -0,0 +1,253 @@
+"""run_benchmarks.py - Load test every controller function on the testbed.
+
+Seeds the datastore and memcache stubs with users, games and scores, then
+calls each function of the games, scores and users controllers with random
+arguments, and finally runs a weighted mix of all of them. Reports p50/p99
+latency, API calls per call and the serialized sizes of the seeded entities,
+and writes them as JSON so runs on two commits can be diffed:
+
+    GAE_SDK=/path/to/google_appengine python -m benchmarks.run_benchmarks \\
+        --users 200 --games 5 --scores 20 --calls 200 --output bench.json
+"""
+
+import argparse
+import json
+import random
+import subprocess
+import time
+from datetime import date
+
+from benchmarks.sdk import ROOT, setup_sdk, start_testbed, RpcCounter
+
+setup_sdk()
+
+import endpoints
+from google.appengine.ext import ndb
+
+import controllers.games_controller as games_ctrl
+import controllers.scores_controller as scores_ctrl
+import controllers.users_controller as users_ctrl
+from models.user_model import User
+from models.game_model import Game, GuessForm
+from models.score_model import Score
+from word_source import get_word_source
+
+# Relative frequency of each call in the mixed workload
+MIX = {
+    'guess_letter': 40,
+    'get_game': 15,
+    'guess_word': 3,
+    'create_game': 5,
+    'batch_guess': 3,
+    'get_games': 3,
+    'get_game_history': 3,
+    'get_user_games': 5,
+    'get_hint': 2,
+    'cancel_game': 1,
+    'get_scores': 3,
+    'get_user_scores': 3,
+    'get_high_scores': 8,
+    'get_user_rankings': 6,
+    'get_user': 1,
+    'get_user_stats': 2,
+    'create_user': 1,
+}
+
+
+class Workload(object):
+    """Seeded data and a random call for each controller function"""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.user_names = []
+        self.game_keys = []
+        self.created_users = 0
+
+    def seed(self, users, games, scores):
+        """Create users, each with active games and finished game scores"""
+        words = get_word_source()
+        for number in range(users):
+            user = User.create(user_name='user{}'.format(number),
+                               email='user{}@example.com'.format(number))
+            self.user_names.append(user.user_name)
+            for _ in range(games):
+                word = words.choose()
+                game = Game.create_game(user=user.key, misses_allowed=5,
+                                        secret_word=word,
+                                        current_solution='_' * len(word))
+                self.game_keys.append(game.key.urlsafe())
+            ndb.put_multi([
+                Score(user=user.key, user_name=user.user_name,
+                      date=date.today(),
+                      won=self.rng.random() < 0.5,
+                      score=self.rng.randint(0, 200))
+                for _ in range(scores)])
+
+    def user_name(self):
+        return self.rng.choice(self.user_names)
+
+    def game_key(self):
+        return self.rng.choice(self.game_keys)
+
+    def letter(self):
+        return self.rng.choice('ETAOINSHRDLUCMFWYPVBGKJQXZ')
+
+    def calls(self):
+        """Returns a dict of call name to a function making that call"""
+        def create_game():
+            state = games_ctrl.create_game(self.user_name(), None)
+            self.game_keys.append(state.urlsafe_game_key)
+
+        def create_user():
+            self.created_users += 1
+            users_ctrl.create_user('new{}'.format(self.created_users))
+
+        def batch_guess():
+            guesses = [GuessForm(letter_guess=self.letter())
+                       for _ in range(5)]
+            games_ctrl.batch_guess(self.game_key(), guesses)
+
+        return {
+            'create_game': create_game,
+            'get_game': lambda: games_ctrl.get_game(self.game_key()),
+            'guess_letter': lambda: games_ctrl.guess_letter(self.game_key(),
+                                                            self.letter()),
+            'guess_word': lambda: games_ctrl.guess_word(
+                self.game_key(), get_word_source().choose()),
+            'batch_guess': batch_guess,
+            'get_games': lambda: games_ctrl.get_games(
+                [self.game_key() for _ in range(20)]),
+            'get_game_history': lambda: games_ctrl.get_game_history(
+                self.game_key()),
+            'get_user_games': lambda: games_ctrl.get_user_games(
+                self.user_name()),
+            'get_hint': lambda: games_ctrl.get_hint(self.game_key()),
+            'cancel_game': lambda: games_ctrl.cancel_game(self.game_key()),
+            'get_scores': lambda: scores_ctrl.get_scores(),
+            'get_user_scores': lambda: scores_ctrl.get_user_scores(
+                self.user_name()),
+            'get_high_scores': lambda: scores_ctrl.get_high_scores(None),
+            'get_user_rankings': lambda: users_ctrl.get_user_rankings(),
+            'get_user': lambda: users_ctrl.get_user(self.user_name()),
+            'get_user_stats': lambda: users_ctrl.get_user_stats(
+                self.user_name()),
+            'create_user': create_user,
+        }
+
+
+def percentile(values, fraction):
+    """Returns a percentile of a list of numbers"""
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def measure(calls, names, counter):
+    """Make each call and return its latency, API call and error stats"""
+    latencies = []
+    rpcs = {}
+    errors = 0
+    for name in names:
+        # Every call is a new request, with an empty ndb context cache
+        ndb.get_context().clear_cache()
+        with counter:
+            start = time.time()
+            try:
+                calls[name]()
+            except endpoints.ServiceException:
+                errors += 1
+            latencies.append((time.time() - start) * 1000)
+        for rpc, count in counter.calls.items():
+            rpcs[rpc] = rpcs.get(rpc, 0) + count
+    return {
+        'calls': len(names),
+        'errors': errors,
+        'p50_ms': percentile(latencies, 0.5),
+        'p99_ms': percentile(latencies, 0.99),
+        'rpcs_per_call': dict((rpc, count / float(len(names)))
+                              for rpc, count in sorted(rpcs.items())),
+        'total_rpcs_per_call': sum(rpcs.values()) / float(len(names)),
+    }
+
+
+def entity_sizes():
+    """Returns the average and maximum serialized size of each kind"""
+    sizes = {}
+    for model in (User, Game, Score):
+        encoded = [len(ndb.model_to_protobuf(entity).Encode())
+                   for entity in model.query().fetch(500)]
+        if encoded:
+            sizes[model._get_kind()] = {
+                'average_bytes': sum(encoded) / float(len(encoded)),
+                'max_bytes': max(encoded),
+            }
+    return sizes
+
+
+def git_commit():
+    """Returns the current commit, or None outside a git checkout"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       cwd=ROOT).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--games', type=int, default=5,
+                        help='active games per user')
+    parser.add_argument('--scores', type=int, default=10,
+                        help='scores per user')
+    parser.add_argument('--calls', type=int, default=100,
+                        help='calls per function, and ten times this many '
+                             'calls for the mix')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench_output.json')
+    args = parser.parse_args()
+
+    bed = start_testbed()
+    try:
+        workload = Workload(random.Random(args.seed))
+        start = time.time()
+        workload.seed(args.users, args.games, args.scores)
+        seed_seconds = time.time() - start
+
+        calls = workload.calls()
+        counter = RpcCounter()
+        results = {}
+        for name in sorted(calls):
+            results[name] = measure(calls, [name] * args.calls, counter)
+            print('{:20} p50 {:7.2f} ms  p99 {:7.2f} ms  {:5.1f} RPCs'.format(
+                name, results[name]['p50_ms'], results[name]['p99_ms'],
+                results[name]['total_rpcs_per_call']))
+
+        weighted = [name for name, weight in sorted(MIX.items())
+                    for _ in range(weight)]
+        mix = [workload.rng.choice(weighted)
+               for _ in range(args.calls * 10)]
+        results['mix'] = measure(calls, mix, counter)
+        print('{:20} p50 {:7.2f} ms  p99 {:7.2f} ms  {:5.1f} RPCs'.format(
+            'mix', results['mix']['p50_ms'], results['mix']['p99_ms'],
+            results['mix']['total_rpcs_per_call']))
+
+        report = {
+            'commit': git_commit(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'volumes': {'users': args.users, 'games_per_user': args.games,
+                        'scores_per_user': args.scores},
+            'seed_seconds': seed_seconds,
+            'functions': results,
+            'entity_sizes': entity_sizes(),
+        }
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+        print('Results written to {}'.format(args.output))
+    finally:
+        bed.deactivate()
+
+
+if __name__ == '__main__':
+    main()
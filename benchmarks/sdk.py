@@ -0,0 +1,65 @@
+"""sdk.py - Helpers to run benchmarks against the App Engine SDK testbed.
+
+Benchmarks are run from the repository root, e.g.
+    GAE_SDK=/path/to/google_appengine python -m benchmarks.history_encoding
+GAE_SDK is the directory of the SDK that holds dev_appserver.py.
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_sdk():
+    """Put the App Engine SDK and the repository on sys.path"""
+    sdk = os.environ.get('GAE_SDK')
+    if sdk:
+        sys.path.insert(0, sdk)
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+
+
+def start_testbed():
+    """Activate a testbed with the datastore, memcache and taskqueue stubs"""
+    from google.appengine.datastore import datastore_stub_util
+    from google.appengine.ext import ndb, testbed
+
+    bed = testbed.Testbed()
+    bed.activate()
+    policy = datastore_stub_util.PseudoRandomHRConsistencyPolicy(probability=1)
+    bed.init_datastore_v3_stub(consistency_policy=policy)
+    bed.init_memcache_stub()
+    bed.init_taskqueue_stub(root_path=ROOT)
+    ndb.get_context().clear_cache()
+    return bed
+
+
+class RpcCounter(object):
+    """Counts the API calls made while it is active, by service.method"""
+
+    def __init__(self):
+        self.calls = {}
+        self.active = False
+        from google.appengine.api import apiproxy_stub_map
+        apiproxy_stub_map.apiproxy.GetPreCallHooks().Append(
+            'rpc_counter_{}'.format(id(self)), self._hook)
+
+    def _hook(self, service, call, request, response):
+        if self.active:
+            name = '{}.{}'.format(service, call)
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def __enter__(self):
+        self.calls = {}
+        self.active = True
+        return self
+
+    def __exit__(self, *exc_info):
+        self.active = False
+
+    def total(self):
+        """Returns the total number of calls"""
+        return sum(self.calls.values())
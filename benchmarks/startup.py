@@ -0,0 +1,82 @@
+"""startup.py - Import time and first request latency of a new instance.
+
+Each measurement runs in a fresh process, like a new instance:
+    import_main    import the cron and task app
+    import_api     import the endpoints API
+    cold_request   import the API and make a first create_game request
+    warm_request   run the warmup handler, then time the first create_game
+                   request alone
+Run it from the repository root:
+    GAE_SDK=/path/to/google_appengine python -m benchmarks.startup [runs]
+"""
+
+import subprocess
+import sys
+import time
+
+MODES = ('import_main', 'import_api', 'cold_request', 'warm_request')
+DEFAULT_RUNS = 5
+
+
+def seed_user(name):
+    """Store a user without importing the models, which would otherwise be
+    imported before the measurement"""
+    from google.appengine.api import datastore
+    user = datastore.Entity('User', name=name)
+    user.update({'user_name': name, 'email': '', 'score': 0,
+                 'ranking_score': 0})
+    datastore.Put(user)
+
+
+def first_request():
+    """Make a create_game request"""
+    import controllers.games_controller as games_ctrl
+    games_ctrl.create_game('bench', '5')
+
+
+def measure(mode):
+    """Print the seconds a mode takes in this process"""
+    from benchmarks.sdk import setup_sdk, start_testbed
+    setup_sdk()
+
+    if mode == 'import_main':
+        start = time.time()
+        import main
+        print(time.time() - start)
+        return
+
+    bed = start_testbed()
+    try:
+        seed_user('bench')
+        if mode == 'warm_request':
+            import webapp2
+            import warmup
+            webapp2.Request.blank('/_ah/warmup').get_response(warmup.app)
+
+        start = time.time()
+        if mode in ('import_api', 'cold_request'):
+            import api
+        if mode != 'import_api':
+            first_request()
+        print(time.time() - start)
+    finally:
+        bed.deactivate()
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_RUNS
+    for mode in MODES:
+        seconds = sorted(
+            float(subprocess.check_output(
+                [sys.executable, '-m', 'benchmarks.startup', '--measure',
+                 mode]).split()[-1])
+            for _ in range(runs))
+        print('{:14} median {:8.1f} ms  max {:8.1f} ms'.format(
+            mode, seconds[len(seconds) // 2] * 1000, seconds[-1] * 1000))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3 and sys.argv[1] == '--measure':
+        measure(sys.argv[2])
+    else:
+        main()
@@ -0,0 +1,87 @@
+"""word_source_load.py - Startup time and memory of a large word file.
+
+Writes a file of synthetic words, then measures how long WordSource takes to
+load it, with and without a saved index, how much the process RSS grows, and
+how long choosing a random word takes. Loading the same words as a list of
+str objects is measured for comparison. Each measurement runs in its own
+process. Runs without the SDK:
+    python -m benchmarks.word_source_load [number_of_words]
+"""
+
+import os
+import random
+import resource
+import string
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+from word_source import WordSource, INDEX_SUFFIX
+
+REPEAT = 100000
+
+
+def rss_kb():
+    """Returns the current resident set size in KB (Linux only)"""
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def write_words(path, count):
+    """Write count random words of 4 to 14 letters"""
+    rng = random.Random(0)
+    with open(path, 'w') as words_file:
+        for _ in range(count):
+            length = rng.randint(4, 14)
+            words_file.write(''.join(rng.choice(string.ascii_uppercase)
+                                     for _ in range(length)) + '\n')
+
+
+def measure(path, mode):
+    """Load the words and print the load time and RSS growth"""
+    before = rss_kb()
+    start = time.time()
+    if mode == 'list':
+        with open(path) as words_file:
+            source = words_file.read().split()
+        choose = lambda: random.choice(source)
+    else:
+        source = WordSource.from_file(path)
+        choose = lambda: source.choose(8, 'hard')
+    seconds = time.time() - start
+    grown = rss_kb() - before
+    per_choice = timeit.timeit(choose, number=REPEAT) / REPEAT * 1e6
+    print('{:12} load {:6.2f} s, RSS +{:7} KB, {:5.2f} us per choice'.format(
+        mode, seconds, grown, per_choice))
+
+
+def main():
+    if len(sys.argv) > 2:
+        measure(sys.argv[1], sys.argv[2])
+        return
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    handle, path = tempfile.mkstemp(suffix='.txt')
+    os.close(handle)
+    try:
+        write_words(path, count)
+        print('{} words, {} KB file'.format(count,
+                                            os.path.getsize(path) // 1024))
+        for mode in ('build', 'indexed', 'list'):
+            if mode == 'indexed':
+                WordSource.from_file(path).save_index(path)
+            subprocess.check_call([sys.executable, '-m',
+                                   'benchmarks.word_source_load', path, mode])
+    finally:
+        for name in (path, path + INDEX_SUFFIX):
+            if os.path.exists(name):
+                os.remove(name)
+
+
+if __name__ == '__main__':
+    main()
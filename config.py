@@ -2,4 +2,65 @@
 
 LETTER_POINT = 10
 WORD_POINT = 20
-BLANK_POINT = 20
\ No newline at end of file
+BLANK_POINT = 20
+
+# Listing endpoints return at most MAX_PAGE_SIZE items per request
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Leaderboards keep the top LEADERBOARD_SIZE entries, split over shards so
+# that concurrent game endings don't contend on a single entity.
+LEADERBOARD_SIZE = 100
+LEADERBOARD_SHARDS = 4
+
+# Each user's total score is split over this many counter shards
+USER_SCORE_SHARDS = 10
+
+# Number of games each instance keeps in its in-process game cache
+GAME_CACHE_SIZE = 1000
+
+# Secret words are chosen from this file, one word per line
+WORDS_FILE = 'words/words.txt'
+
+# Users checked by each reminder email task
+REMINDER_BATCH_SIZE = 100
+
+# Most guesses a single batch_guess request may contain
+MAX_BATCH_GUESSES = 50
+
+# Also look users up by a user_name query, for users created before users
+# were keyed by name. Turn off once the rekey_users migration has run.
+LEGACY_USER_LOOKUP = True
+
+# Requests per endpoint kept in the rolling window of /_admin/stats
+STATS_WINDOW = 1000
+
+# Score and ranking listing queries fetch only the fields they return, with
+# projection queries. Scores without a user_name are left out of projection
+# queries, so this is off until the backfill_score_user_names migration has
+# run. Turn it on afterwards.
+LIGHTWEIGHT_LISTINGS = False
+
+# Seconds a cached listing response is kept in memcache. A write moves the
+# listings it changes to new cache keys, so this only bounds how long
+# eventually consistent query results can be served.
+RESPONSE_CACHE_SECONDS = 300
+
+# Create games as root entities, found by their indexed user property,
+# instead of in their user's entity group so that a user's games don't share
+# one group's write rate. Turn on, then run the reparent_games migration.
+ROOT_GAMES = False
+
+# Points taken off a game's score for each hint
+HINT_PENALTY = 5
+
+# Days a daily high scores leaderboard, and weeks a weekly one, are kept
+# after the period starts. The expire_leaderboards cron then deletes it.
+DAILY_LEADERBOARD_DAYS = 14
+WEEKLY_LEADERBOARD_WEEKS = 12
+
+# Find active, finished and cancelled games by their indexed status, which
+# leaves game_over and game_cancelled unindexed. Games saved before status
+# existed are left out of these queries, so this is off until the
+# reindex_entities migration has run. Turn it on afterwards.
+GAME_STATUS_QUERIES = False
\ No newline at end of file
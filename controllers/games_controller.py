@@ -1,10 +1,21 @@
 import endpoints
 from datetime import date
 
-from utils import secret_word_generator
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+import game_engine
+import response_cache
+from hint_engine import get_hint_index
+
+from config import MAX_BATCH_GUESSES, MAX_PAGE_SIZE
+from utils import secret_word_generator, fetch_page, keys_from_urlsafe
+from word_source import DIFFICULTIES
 
 from models.user_model import User
 from models.score_model import Score
+from models.counter_model import UserScoreShard
+from models.stats_model import UserStats
 from models.game_model import (
     Game,
     GameStateForm,
@@ -14,12 +25,27 @@ from models.game_model import (
     GuessWordForm,
     GameHistoryForm,
     GameHistoryForms,
+    GuessResultForm,
+    BatchGuessResultForm,
+    GameErrorForm,
+    HintForm,
 )
 
-def create_game(user_name, misses_allowed):
+def create_game(user_name, misses_allowed, word_length=None,
+                difficulty=None):
     """Create a game"""
     user = User.get_by_name(user_name)
-    secret_word = secret_word_generator()
+
+    if difficulty and difficulty not in DIFFICULTIES:
+        msg = 'Error, difficulty must be one of {}'.format(
+            ', '.join(DIFFICULTIES))
+        raise endpoints.BadRequestException(msg)
+
+    try:
+        secret_word = secret_word_generator(word_length, difficulty or None)
+    except LookupError:
+        msg = 'Sorry, there are no words of that length and difficulty'
+        raise endpoints.BadRequestException(msg)
     current_solution = ''.join(['_' for l in secret_word])
 
     # Check if misses_allowed exists and if so make sure it's a number
@@ -45,176 +71,199 @@ def get_game(urlsafe_game_key):
     game = Game.get_game(urlsafe_game_key)
     return game.game_state("Here's the game you requested")
 
-def guess_letter(urlsafe_game_key, letter_guess):
-    """Make a letter guess in a game"""
-    letter_guess = letter_guess.upper()
-    game = Game.get_game(urlsafe_game_key)
-
-    # If the game is already over
-    if game.game_over:
-        msg = 'Error, This game is already over.'
-        raise endpoints.BadRequestException(msg)
-
-    # If the game has been cancelled
-    if game.game_cancelled:
-        msg = 'Error, this game has been cancelled.'
-        raise endpoints.BadRequestException(msg)
-
-    # Check for illegal characters
-    if not letter_guess.isalpha():
-        msg = 'Error, only letters from a-z are accepted'
+def get_games(urlsafe_game_keys):
+    """Get the state of several games. Games and their users are read in
+    batches, keys that can't be returned are listed in errors"""
+    if len(urlsafe_game_keys) > MAX_PAGE_SIZE:
+        msg = 'Error, you can only request {} games at a time.'.format(
+            MAX_PAGE_SIZE)
         raise endpoints.BadRequestException(msg)
 
-    # If more than one letter is submitted.
-    if len(letter_guess) > 1:
-        msg = 'Error, you can only choose one letter at a time.'
-        raise endpoints.BadRequestException(msg)
-
-    # If letter guess has already been tried.
-    if game.letters_guessed and letter_guess in game.letters_guessed:
-        msg = 'Sorry, you already tried that letter, please pick another.'
-        raise endpoints.BadRequestException(msg)
-
-    # If letter guess is incorrect.
-    if letter_guess not in game.secret_word:
-        msg = 'Sorry, that is incorrect'
-        game.decrement_misses_remaining()
-        game.update_letters_guessed(letter_guess)
-        game.update_history(guess=letter_guess, result='Incorrect')
-
-        if game.misses_remaining < 1:
-            end_game(game, False)
-            game.put()
-            msg = 'Sorry, that is incorrect and the game is now over.'
-            return game.game_state(msg)
-
-        game.put()
-        return game.game_state(msg)
-
-    # If letter guess is correct
-    if letter_guess in game.secret_word:
-        num_of_letters = game.secret_word.count(letter_guess)
-        game_won = update_current_solution(game, letter_guess)
-        game.update_letters_guessed(letter_guess)
-        game.update_history(guess=letter_guess, result='Correct')
-
-        if game_won:
-            msg = "Great Job, you won the game!"
-            game.update_score(letters=num_of_letters, words=1)
-            end_game(game, True)
+    decoded = keys_from_urlsafe(urlsafe_game_keys, Game)
+    keys = [key for key, error in decoded if key]
+    games = dict(zip(keys, Game.get_games(keys)))
+    user_keys = list(set(game.user for game in games.values() if game))
+    users = dict(zip(user_keys, ndb.get_multi(user_keys)))
+
+    items = []
+    errors = []
+    for urlsafe, (key, error) in zip(urlsafe_game_keys, decoded):
+        game = games.get(key) if key else None
+        if error is None and game is None:
+            error = 'No Game Found'
+        if error:
+            errors.append(GameErrorForm(urlsafe_game_key=urlsafe, error=error))
         else:
-            game.update_score(letters=num_of_letters)
-            msg = 'Nice Job, the letter {} is in the secret word'.format(letter_guess)
+            items.append(game.game_state(user=users[game.user]))
+    return GameStateForms(items=items, errors=errors)
+
+def play(move, state, *args):
+    """Make a game_engine move on a game's rules state. Returns the move's
+    result message.
+    Raises:
+        BadRequestException: If the rules don't allow the move"""
+    try:
+        return move(state, *args)
+    except game_engine.GameRuleError as e:
+        raise endpoints.BadRequestException(str(e))
+
+def save_state(game, state, msg):
+    """Save a game after moves were made on its rules state and return its
+    state form"""
+    game.apply_engine_state(state)
+    if state.over:
+        user = end_game(game, state.won)
+        return game.game_state(msg, user)
+
+    game.save()
+    return game.game_state(msg)
 
-        game.put()
-        return game.game_state(msg)
+def guess_letter(urlsafe_game_key, letter_guess):
+    """Make a letter guess in a game"""
+    game = Game.get_game(urlsafe_game_key)
+    state = game.engine_state()
+    msg = play(game_engine.guess_letter, state, letter_guess)
+    return save_state(game, state, msg)
 
 def guess_word(urlsafe_game_key, word_guess):
     """Make a word guess in a game"""
-    word_guess = word_guess.upper()
     game = Game.get_game(urlsafe_game_key)
-
-    # If the game is already over
-    if game.game_over:
-        msg = 'Error, This game is already over.'
-        raise endpoints.BadRequestException(msg)
-
-    # If the game has been cancelled
-    if game.game_cancelled:
-        msg = 'Error, this game has been cancelled.'
+    state = game.engine_state()
+    msg = play(game_engine.guess_word, state, word_guess)
+    return save_state(game, state, msg)
+
+def batch_guess(urlsafe_game_key, guesses):
+    """Apply a list of letter and word guesses in order, with one read and
+    one write of the game. Stops at the end of the game. Guesses that are not
+    allowed are reported in their result and leave the game unchanged."""
+    if len(guesses) > MAX_BATCH_GUESSES:
+        msg = 'Error, you can only send {} guesses at a time.'.format(
+            MAX_BATCH_GUESSES)
         raise endpoints.BadRequestException(msg)
 
-    # Check for illegal characters
-    if not word_guess.isalpha():
-        msg = 'Error, only letters from a-z are accepted'
-        raise endpoints.BadRequestException(msg)
-
-    # If the guess is incorrect
-    if word_guess != game.secret_word:
-        game.decrement_misses_remaining()
-        game.update_history(guess=word_guess, result='Incorrect')
-        if game.misses_remaining < 1:
-            end_game(game, False)
-            game.update_history(guess='', result='Game Lost')
-            msg = 'Sorry, that was the wrong answer and the game is over'
-        else:
-            msg = 'Sorry, that was not the correct answer'
-
-        game.put()
-        return game.game_state(msg)
-
-    # If the guess is correct
-    if word_guess == game.secret_word:
-        blanks = game.current_solution.count('_')
-        game.update_score(blanks=blanks, words=1)
-        game.update_history(guess=word_guess, result='Correct')
-        end_game(game, True)
-        msg = 'Congratulations! you win!'
+    game = Game.get_game(urlsafe_game_key)
+    state = game.engine_state()
+    play(game_engine.check_playable, state)
+
+    results = []
+    msg = ''
+    for guess in guesses:
+        if state.over:
+            break
+        try:
+            if guess.letter_guess:
+                msg = game_engine.guess_letter(state, guess.letter_guess)
+            elif guess.word_guess:
+                msg = game_engine.guess_word(state, guess.word_guess)
+            else:
+                raise game_engine.GameRuleError(
+                    'Error, a guess needs a letter_guess or a word_guess')
+        except game_engine.GameRuleError as e:
+            results.append(GuessResultForm(letter_guess=guess.letter_guess,
+                                           word_guess=guess.word_guess,
+                                           message=str(e), error=True))
+            continue
+        results.append(GuessResultForm(letter_guess=guess.letter_guess,
+                                       word_guess=guess.word_guess,
+                                       message=msg, error=False))
+
+    if state.history:
+        form = save_state(game, state, msg)
+    else:
+        form = game.game_state('None of the guesses were allowed')
+    return BatchGuessResultForm(results=results, state=form)
 
-        game.put()
-        return game.game_state(msg)
+def get_game_history(urlsafe_game_key, if_none_match=None):
+    """Get a games history.
 
-def get_game_history(urlsafe_game_key):
-    """Get a games history"""
+    Games are already read through the game cache, so the history isn't
+    cached again. Its ETag comes from the game's version, which every save
+    of the game, including cancel_game and end_game, moves on.
+    """
     game = Game.get_game(urlsafe_game_key)
-    return game.create_history_form()
-
-def get_user_games(user_name):
-    """Get a user's games"""
+    etag = response_cache.make_etag('game_history', game.version,
+                                    game.key.urlsafe())
+    if if_none_match == etag:
+        return GameHistoryForms(etag=etag, not_modified=True)
+    form = game.create_history_form()
+    form.etag = etag
+    return form
+
+def get_user_games(user_name, page_size=None, cursor=None):
+    """Get a page of a user's games"""
     user = User.get_by_name(user_name)
-    games = Game.query(ancestor=user.key)
-    games = games.filter(Game.game_cancelled == False,
-                         Game.game_over == False)
-    return GameStateForms(items=[game.game_state() for game in games])
-
-def cancel_game(urlsafe_game_key):
-    """Cancels a game"""
+    games = Game.query_user_games(user.key)
+    games = games.filter(Game.status_filter(Game.ACTIVE))
+    games, next_cursor = fetch_page(games, page_size, cursor)
+    return GameStateForms(items=[game.game_state() for game in games],
+                          next_cursor=next_cursor)
+
+def get_hint(urlsafe_game_key):
+    """Suggest the next letter of a game, taking a hint penalty off its
+    score"""
     game = Game.get_game(urlsafe_game_key)
-    msg = 'The game has been cancelled'
+    state = game.engine_state()
+    play(game_engine.check_playable, state)
 
-    # If the requested game is already over.
-    if game.game_over:
-        msg = 'This game is already over'
+    letter, candidates = get_hint_index().suggest(game.current_solution,
+                                                  game.guessed_letters())
+    if not letter:
+        msg = 'Sorry, there is no hint for this word'
         raise endpoints.BadRequestException(msg)
 
-    # If the requested game has already been cancelled.
-    if game.game_cancelled:
-        msg = 'This game has already been cancelled'
-        raise endpoints.BadRequestException(msg)
+    msg = play(game_engine.hint, state, letter)
+    game.apply_engine_state(state)
+    game.save()
+    return HintForm(letter=letter, candidate_words=candidates,
+                    state=game.game_state(msg))
 
-    game.game_cancelled = True
-    game.update_history(guess='', result='Game Cancelled')
-    game.put()
-    return game.game_state(msg)
+def cancel_game(urlsafe_game_key):
+    """Cancels a game"""
+    game = Game.get_game(urlsafe_game_key)
+    state = game.engine_state()
+    msg = play(game_engine.cancel, state)
+    game.apply_engine_state(state)
+    user = game.user.get()
+    game.save(lambda: UserStats.add_game_async(user.user_name, game))
+    return game.game_state(msg, user)
 
 def end_game(game, won=False):
-    """Ends a game"""
-    game.game_over = True
-
-    if won:
-        game.update_history(guess='', result='Game Won')
-        game.current_solution = game.secret_word
-        user = game.user.get()
-        user.score += game.score
-        user.put()
-        score = Score(
-            user=game.user,
-            date=date.today(),
-            won=won,
-            score=game.score)
-        score.put()
-    else:
-        game.update_history(guess='', result='Game Lost')
-
-def update_current_solution(game, letter):
-    """Update the current solution."""
-    # Get the indices of the letter matches
-    matches = [i for i, x in enumerate(list(game.secret_word)) if x == letter]
-    solution = list(game.current_solution)
-    for match in matches:
-        solution[match] = letter
-    game.current_solution = ''.join(solution)
-    if game.current_solution == game.secret_word:
-        return True
-    else:
-        return False
\ No newline at end of file
+    """Saves a game the rules have ended. Returns the game's User.
+
+    The game and the user's stats are written in one cross-group
+    transaction. For a won game, its Score and the user's score counter are
+    written concurrently in the same transaction, which also queues a task to
+    update the leaderboards. The leaderboard shards are shared by every
+    game, so a contended shard only delays the task instead of failing the
+    winning move.
+    """
+    user_future = game.user.get_async()
+
+    if not won:
+        user = user_future.get_result()
+        game.save(lambda: UserStats.add_game_async(user.user_name, game))
+        return user
+
+    user = user_future.get_result()
+    score = Score(
+        user=game.user,
+        user_name=user.user_name,
+        date=date.today(),
+        won=won,
+        score=game.score)
+
+    @ndb.tasklet
+    def in_transaction():
+        score_key, _, _ = yield (
+            score.put_async(),
+            UserScoreShard.increment_async(game.user, game.score),
+            UserStats.add_game_async(user.user_name, game, won))
+        task = taskqueue.Task(url='/tasks/leaderboards',
+                              params={'score': score_key.urlsafe()})
+        yield task.add_async(transactional=True)
+
+    game.save(in_transaction)
+    UserScoreShard.increment_cached_total(game.user, game.score)
+    response_cache.bump(response_cache.SCORES,
+                        response_cache.user_scores_scope(user.user_name))
+    return user
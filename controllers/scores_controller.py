@@ -1,29 +1,111 @@
 import endpoints
-from datetime import date
+from datetime import date, datetime
+
+import response_cache
+from config import LIGHTWEIGHT_LISTINGS
+from utils import fetch_page, clamp_page_size, first_page_keys
 
 from models.user_model import User
 from models.game_model import Game
+from models.leaderboard_model import (
+    Leaderboard,
+    HIGH_SCORES,
+    PERIODS,
+    period_board,
+)
 from models.score_model import (
     Score,
     ScoreForm,
     ScoreForms,
 )
 
-def get_scores():
-    """Get all scores"""
-    return ScoreForms(items=[score.create_form() for score in Score.query()])
+def fetch_score_forms(query, page_size=None, cursor=None):
+    """Fetch a page of a score query as ScoreForms. Only the fields of the
+    forms are fetched, with a projection query, if LIGHTWEIGHT_LISTINGS is
+    set"""
+    projection = Score.LISTING_PROJECTION if LIGHTWEIGHT_LISTINGS else None
+    scores, next_cursor = fetch_page(query, page_size, cursor, projection)
+    return Score.create_forms(scores, next_cursor)
+
+
+def get_scores(page_size=None, cursor=None, if_none_match=None):
+    """Get a page of all scores, through the response cache"""
+    def build():
+        return fetch_score_forms(Score.query(), page_size, cursor)
+    return response_cache.get_or_build(
+        response_cache.SCORES, ('scores', page_size, cursor), ScoreForms,
+        build, if_none_match)
+
+
+def get_user_scores(user_name, page_size=None, cursor=None,
+                    if_none_match=None):
+    """Get a page of a user's scores, through the response cache"""
+    def build():
+        user = User.get_by_name(user_name)
+        return fetch_score_forms(Score.query(Score.user == user.key),
+                                 page_size, cursor)
+    return response_cache.get_or_build(
+        response_cache.user_scores_scope(user_name),
+        (user_name, page_size, cursor), ScoreForms, build, if_none_match)
+
+
+def get_high_scores(number_of_results, page_size=None, cursor=None,
+                    if_none_match=None, period=None, day=None):
+    """Return a page of the high scores, through the response cache.
+
+    number_of_results is kept for older clients and is used as the page size
+    when page_size is not given. The first page is served from the high
+    scores leaderboard once rebuild_leaderboards has built it, with a cursor
+    into the score query for the next page. A keys only query checks that the
+    leaderboard matches the query's first page, while a win's leaderboard
+    task is pending or scores tie in another order the page is queried.
+
+    With a period of day or week, the top scores of the day or ISO week
+    containing day (YYYY-MM-DD, default today) are read from that period's
+    leaderboard. These hold the top LEADERBOARD_SIZE scores and have no
+    further pages.
+    """
+    if number_of_results and page_size is None:
+        if not number_of_results.isnumeric():
+            msg = 'Error, only numbers are allowed in number_of_results'
+            raise endpoints.BadRequestException(msg)
+        page_size = int(number_of_results)
 
+    if period and period != 'all':
+        if period not in PERIODS:
+            msg = 'Error, period must be one of all, {}'.format(
+                ', '.join(PERIODS))
+            raise endpoints.BadRequestException(msg)
+        try:
+            day = (datetime.strptime(day, '%Y-%m-%d').date() if day
+                   else date.today())
+        except ValueError:
+            msg = 'Error, date must be in the format YYYY-MM-DD'
+            raise endpoints.BadRequestException(msg)
+        board = period_board(period, day)
 
-def get_user_scores(user_name):
-    """Get a user's scores"""
-    user = User.get_by_name(user_name)
-    scores = Score.query(Score.user == user.key)
-    return ScoreForms(items=[score.create_form() for score in scores])
+        def build_period():
+            top = Leaderboard.get_top(board, clamp_page_size(page_size))
+            return ScoreForms(items=[entry.create_score_form()
+                                     for entry in top or []])
+        return response_cache.get_or_build(
+            response_cache.SCORES, (board, page_size), ScoreForms,
+            build_period, if_none_match)
 
+    def build():
+        query = Score.query().order(-Score.score)
+        if not cursor:
+            top = Leaderboard.get_top(HIGH_SCORES, clamp_page_size(page_size),
+                                      built_only=True)
+            keys, next_cursor = first_page_keys(query, page_size)
+            # Served from the leaderboard only when it holds the same scores
+            # in the same order as the query, so the next page follows on
+            if top is not None and [e.score_key for e in top] == keys:
+                return ScoreForms(items=[entry.create_score_form()
+                                         for entry in top],
+                                  next_cursor=next_cursor)
 
-def get_high_scores(number_of_results):
-    """Return the high scores"""
-    scores = Score.query().order(-Score.score)
-    if number_of_results:
-        scores = scores.fetch(int(number_of_results))
-    return ScoreForms(items=[score.create_form() for score in scores])
\ No newline at end of file
+        return fetch_score_forms(query, page_size, cursor)
+    return response_cache.get_or_build(
+        response_cache.SCORES, ('high_scores', page_size, cursor), ScoreForms,
+        build, if_none_match)
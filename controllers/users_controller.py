@@ -1,5 +1,11 @@
 import endpoints
 
+import response_cache
+from config import LIGHTWEIGHT_LISTINGS
+from utils import fetch_page, clamp_page_size, first_page_keys
+from models.leaderboard_model import Leaderboard, USER_RANKINGS
+from models.stats_model import UserStats
+
 from models.user_model import (
     User,
     RankingForm,
@@ -11,6 +17,7 @@ from models.user_model import (
 def create_user(user_name, email=''):
     """Create a user"""
     user = User.create(user_name=user_name, email=email)
+    response_cache.bump(response_cache.RANKINGS)
     return UserMessage(message = 'User {} has been created'.format(
             user.user_name))
 
@@ -19,11 +26,53 @@ def get_user(user_name):
     user = User.get_by_name(user_name)
     return user
 
-def get_user_rankings():
-    """Get all user rankings"""
-    users = User.query().order(-User.score)
-    return RankingForms(items=[user.create_ranking_form() for user in users])
+def get_user_stats(user_name):
+    """Get a user's game statistics.
+
+    Stats are read with one get of the key of the user name. Users without
+    stats, and users not yet keyed by their name, are looked up first.
+    """
+    stats = None
+    if User.normalize_name(user_name):
+        stats = UserStats.key_for(User.key_for(user_name)).get()
+    if not stats:
+        user = User.get_by_name(user_name)
+        stats = (UserStats.key_for(user.key).get() or
+                 UserStats(user_name=user.user_name))
+    return stats.create_form()
 
+def get_user_rankings(page_size=None, cursor=None, if_none_match=None):
+    """Get a page of user rankings, through the response cache.
 
+    The first page is served from the user rankings leaderboard once
+    rebuild_leaderboards has built it and it matches the first page of the
+    rankings query, with a cursor into that query for the next page.
+    Pages are ordered by ranking_score, which is set with the user's total
+    on the leaderboard after each win, and is also their score in
+    lightweight listings.
+    """
+    def build():
+        query = User.query().order(-User.ranking_score)
+        if not cursor:
+            top = Leaderboard.get_top(USER_RANKINGS,
+                                      clamp_page_size(page_size),
+                                      built_only=True)
+            keys, next_cursor = first_page_keys(query, page_size)
+            # Served from the leaderboard only when it holds the same users
+            # in the same order as the query, so the next page follows on
+            if top is not None and [User.key_for(entry.user_name)
+                                    for entry in top] == keys:
+                return RankingForms(items=[entry.create_ranking_form()
+                                           for entry in top],
+                                    next_cursor=next_cursor)
 
+        if LIGHTWEIGHT_LISTINGS:
+            users, next_cursor = fetch_page(query, page_size, cursor,
+                                            User.RANKING_PROJECTION)
+            return User.create_projected_ranking_forms(users, next_cursor)
 
+        users, next_cursor = fetch_page(query, page_size, cursor)
+        return User.create_ranking_forms(users, next_cursor)
+    return response_cache.get_or_build(
+        response_cache.RANKINGS, (page_size, cursor), RankingForms, build,
+        if_none_match)
\ No newline at end of file
@@ -0,0 +1,233 @@
+"""game_cache.py - Write-through cache for Game entities.
+
+Games are cached as serialized entity protobufs in a bounded in-process LRU
+and in memcache, stamped with the game's version. A small memcache key holds
+the current version of each game so an instance can tell whether its LRU copy
+is still current without fetching the whole entity.
+
+Every save bumps the version inside a transaction that rejects the write if
+the stored version has moved on, so a stale copy can never overwrite a newer
+game.
+
+Cache entries expire after CACHE_SECONDS, and a save that conflicts evicts
+the game, so an entry that missed an update can't be served for long. Games
+are written to memcache with compare and set, and never over a newer version.
+"""
+
+import collections
+import threading
+
+import endpoints
+from google.appengine.api import memcache
+from google.appengine.datastore import entity_pb
+from google.appengine.ext import ndb
+
+from config import GAME_CACHE_SIZE
+from utils import key_from_urlsafe
+
+ENTITY_PREFIX = 'game:'
+VERSION_PREFIX = 'game_version:'
+
+# Seconds a game is kept in memcache
+CACHE_SECONDS = 60 * 60
+
+# Attempts to write a game to memcache while other requests also write it
+CAS_RETRIES = 3
+
+_lock = threading.Lock()
+_lru = collections.OrderedDict()
+_stats = collections.Counter()
+
+
+def _count(name):
+    """Increment one of the hit/miss counters"""
+    with _lock:
+        _stats[name] += 1
+
+
+def _lru_get(urlsafe):
+    """Returns the (version, data) LRU entry of a game, or None"""
+    with _lock:
+        entry = _lru.pop(urlsafe, None)
+        if entry is not None:
+            _lru[urlsafe] = entry
+        return entry
+
+
+def _lru_set(urlsafe, version, data):
+    """Store a (version, data) entry, evicting the least recently used. An
+    entry of a newer version is kept"""
+    with _lock:
+        entry = _lru.pop(urlsafe, None)
+        if entry is not None and entry[0] > version:
+            version, data = entry
+        _lru[urlsafe] = (version, data)
+        while len(_lru) > GAME_CACHE_SIZE:
+            _lru.popitem(last=False)
+
+
+def _encode(entity):
+    """Serialize an entity to a protobuf string"""
+    return ndb.model_to_protobuf(entity).Encode()
+
+
+def _decode(data):
+    """Deserialize an entity from a protobuf string"""
+    return ndb.model_from_protobuf(entity_pb.EntityProto(data))
+
+
+def _cached_version(value):
+    """Returns the version of a memcache value, a version or an entry"""
+    return value[0] if isinstance(value, tuple) else value
+
+
+def _store(entity):
+    """Put an entity into the LRU and memcache, unless they hold a newer
+    version of it. memcache is written with compare and set, so a slower
+    request can't overwrite a newer version with the older one it read"""
+    urlsafe = entity.key.urlsafe()
+    data = _encode(entity)
+    _lru_set(urlsafe, entity.version, data)
+    values = {
+        VERSION_PREFIX + urlsafe: entity.version,
+        ENTITY_PREFIX + urlsafe: (entity.version, data),
+    }
+    client = memcache.Client()
+    for _ in range(CAS_RETRIES):
+        cached = client.get_multi(values.keys(), for_cas=True)
+        added = dict((key, value) for key, value in values.items()
+                     if key not in cached)
+        replaced = dict((key, value) for key, value in values.items()
+                        if key in cached and
+                        _cached_version(cached[key]) < entity.version)
+        failed = []
+        if added:
+            failed.extend(client.add_multi(added, time=CACHE_SECONDS))
+        if replaced:
+            failed.extend(client.cas_multi(replaced, time=CACHE_SECONDS))
+        values = dict((key, values[key]) for key in failed)
+        if not values:
+            return
+    _count('store_conflicts')
+
+
+def get(urlsafe, model):
+    """Returns the entity that a urlsafe key points to, from the cache when
+    possible. Raises the same errors as utils.get_by_urlsafe.
+    Args:
+        urlsafe: A urlsafe key string
+        model: The expected entity kind, it must have a version property
+    Returns:
+        The entity or None if no entity exists."""
+    key = key_from_urlsafe(urlsafe)
+    if key.kind() != model._get_kind():
+        raise ValueError('Incorrect Kind')
+    urlsafe = key.urlsafe()
+
+    version = memcache.get(VERSION_PREFIX + urlsafe)
+    entry = _lru_get(urlsafe)
+    if entry is not None and version is not None and entry[0] == version:
+        _count('lru_hits')
+        return _decode(entry[1])
+
+    entry = memcache.get(ENTITY_PREFIX + urlsafe)
+    if entry is not None and (version is None or entry[0] == version):
+        _count('memcache_hits')
+        _lru_set(urlsafe, entry[0], entry[1])
+        return _decode(entry[1])
+
+    _count('misses')
+    entity = key.get()
+    if entity is not None:
+        _store(entity)
+    return entity
+
+
+def get_multi(keys):
+    """Returns the entities for a list of ndb keys, or None for keys with no
+    entity. memcache is read in one batch and the datastore, with one
+    get_multi, only for the keys that missed"""
+    urlsafes = [key.urlsafe() for key in keys]
+    cached = memcache.get_multi(urlsafes, key_prefix=ENTITY_PREFIX)
+
+    entities = {}
+    for key, urlsafe in zip(keys, urlsafes):
+        if urlsafe in cached:
+            _count('memcache_hits')
+            entities[key] = _decode(cached[urlsafe][1])
+
+    missing = [key for key in keys if key not in entities]
+    for key, entity in zip(missing, ndb.get_multi(missing)):
+        _count('misses')
+        if entity is not None:
+            _store(entity)
+        entities[key] = entity
+    return [entities[key] for key in keys]
+
+
+@ndb.tasklet
+def _put_checked_async(entity, expected_version):
+    """Put an entity if its stored version is still the expected one. Must
+    be called inside a transaction. An entity that no longer exists was
+    deleted or moved to another key, and is not written back"""
+    if entity.key and entity.key.id():
+        current = yield entity.key.get_async(use_cache=False,
+                                             use_memcache=False)
+        if current is None or current.version != expected_version:
+            raise endpoints.ConflictException(
+                'Error, this game was changed by another request, '
+                'please try again.')
+    entity.version = expected_version + 1
+    yield entity.put_async()
+
+
+def save(entity, in_transaction=None):
+    """Write an entity through to the datastore and the cache.
+    Args:
+        entity: The entity to save
+        in_transaction: An optional tasklet function that is run inside the
+            same cross-group transaction, concurrently with the version check,
+            so that its writes commit together with the entity.
+    Raises:
+        ConflictException: If the entity was changed since it was read"""
+    expected_version = entity.version
+
+    @ndb.tasklet
+    def transaction():
+        futures = [_put_checked_async(entity, expected_version)]
+        if in_transaction:
+            futures.append(in_transaction())
+        yield futures
+
+    try:
+        ndb.transaction(transaction, xg=in_transaction is not None)
+    except endpoints.ConflictException:
+        # The cached copy may be one that missed a later save, so the next
+        # read goes to the datastore
+        _count('conflicts')
+        entity.version = expected_version
+        evict([entity.key])
+        raise
+    except Exception:
+        entity.version = expected_version
+        raise
+    _store(entity)
+
+
+def evict(keys):
+    """Remove entities from this instance's LRU and from memcache, for
+    entities that were changed or deleted without save"""
+    urlsafes = [key.urlsafe() for key in keys]
+    with _lock:
+        for urlsafe in urlsafes:
+            _lru.pop(urlsafe, None)
+    memcache.delete_multi([prefix + urlsafe for urlsafe in urlsafes
+                           for prefix in (VERSION_PREFIX, ENTITY_PREFIX)])
+
+
+def stats():
+    """Returns a dict of the cache hit, miss and conflict counters"""
+    with _lock:
+        counters = dict(_stats)
+        counters['lru_size'] = len(_lru)
+    return counters
@@ -0,0 +1,238 @@
+"""game_engine.py - Datastore independent rules of the game.
+
+A game's rules state is a GameState, and each move (guess_letter, guess_word,
+hint, cancel) is a function that checks the move is allowed, raising a
+GameRuleError if it isn't, and then changes the state. The controllers wrap
+these moves around the Game entity, and the simulator plays them directly.
+
+The letters of the secret word that have been revealed are kept as a bitmask
+of positions, bit i being position i of the word. A letter's positions are
+looked up in an index built once per secret word, so a correct guess is a
+mask OR and the win check a comparison against the full mask. Guessed
+letters are kept as a 26 bit mask, see history_codec.
+"""
+
+import collections
+import string
+import threading
+
+from config import LETTER_POINT, WORD_POINT, BLANK_POINT, HINT_PENALTY
+from history_codec import letter_bit
+
+# Secret words come from a dictionary, so their indexes are shared by every
+# game using the same word. The cache is cleared when it reaches this size.
+MAX_INDEXED_WORDS = 10000
+
+_lock = threading.Lock()
+_index_cache = {}
+
+
+def letter_positions(word):
+    """Returns a dict of each letter of a word to a tuple of the mask of its
+    positions and the tuple of its positions"""
+    index = _index_cache.get(word)
+    if index is None:
+        found = {}
+        for position, letter in enumerate(word):
+            found.setdefault(letter, []).append(position)
+        index = dict((letter, (sum(1 << p for p in positions),
+                               tuple(positions)))
+                     for letter, positions in found.items())
+        with _lock:
+            if len(_index_cache) >= MAX_INDEXED_WORDS:
+                _index_cache.clear()
+            _index_cache[word] = index
+    return index
+
+
+def full_mask(word):
+    """Returns the mask with every position of a word revealed"""
+    return (1 << len(word)) - 1
+
+
+def mask_from_solution(solution):
+    """Returns the revealed mask of a current solution string"""
+    mask = 0
+    for position, letter in enumerate(solution):
+        if letter != '_':
+            mask |= 1 << position
+    return mask
+
+
+def count_bits(mask):
+    """Returns the number of set bits in a mask"""
+    return bin(mask).count('1')
+
+
+def is_solved(word, mask):
+    """Returns True if every position of the word is revealed"""
+    return mask == (1 << len(word)) - 1
+
+
+def blanks(word, mask):
+    """Returns the number of positions of the word not yet revealed"""
+    return len(word) - count_bits(mask)
+
+
+def apply_letter(word, mask, solution, letter):
+    """Applies a letter guess to the revealed mask and current solution.
+    Args:
+        word: The secret word
+        mask: The mask of the positions revealed so far
+        solution: The current solution string
+        letter: The guessed letter
+    Returns:
+        A tuple of the new mask, the new solution and the number of positions
+        the letter occupies, which is 0 if the letter is not in the word."""
+    index = _index_cache.get(word) or letter_positions(word)
+    positions = index.get(letter)
+    if positions is None:
+        return mask, solution, 0
+    # Words rarely repeat a letter more than twice, so slicing the string
+    # is cheaper than converting it to a list and back
+    for position in positions[1]:
+        solution = solution[:position] + letter + solution[position + 1:]
+    return mask | positions[0], solution, len(positions[1])
+
+
+class GameRuleError(ValueError):
+    """A move that the rules of the game don't allow"""
+
+
+# Points per letter revealed by a guess, per word solved, per blank left
+# when the word is guessed, and taken off per hint
+Scoring = collections.namedtuple('Scoring', 'letter word blank hint')
+DEFAULT_SCORING = Scoring(LETTER_POINT, WORD_POINT, BLANK_POINT, HINT_PENALTY)
+
+
+def scored(score, scoring=DEFAULT_SCORING, blanks=0, letters=0, words=0,
+           hints=0):
+    """Returns a score with points added. Hint penalties are not clamped at
+    0, so a hint costs the same before the game has any points"""
+    points = (letters * scoring.letter + words * scoring.word +
+              blanks * scoring.blank - hints * scoring.hint)
+    return score + points
+
+
+class GameState(object):
+    """The rules state of one game.
+
+    Moves change the state in place, and append the (guess, result) items
+    they add to the game's history to history.
+    """
+    __slots__ = ('word', 'mask', 'solution', 'misses_remaining', 'guessed',
+                 'score', 'over', 'won', 'cancelled', 'history')
+
+    def __init__(self, word, misses_remaining, mask=0, solution=None,
+                 guessed=0, score=0, over=False, cancelled=False):
+        self.word = word
+        self.mask = mask
+        self.solution = solution or '_' * len(word)
+        self.misses_remaining = misses_remaining
+        self.guessed = guessed
+        self.score = score
+        self.over = over
+        self.won = over and is_solved(word, mask)
+        self.cancelled = cancelled
+        self.history = []
+
+
+def check_playable(state):
+    """Raise a GameRuleError if a game is over or cancelled"""
+    if state.over:
+        raise GameRuleError('Error, This game is already over.')
+    if state.cancelled:
+        raise GameRuleError('Error, this game has been cancelled.')
+
+
+def _end(state, won):
+    """End a game, revealing the word if it was won"""
+    state.over = True
+    state.won = won
+    if won:
+        state.mask = full_mask(state.word)
+        state.solution = state.word
+        state.history.append(('', 'Game Won'))
+    else:
+        state.history.append(('', 'Game Lost'))
+
+
+def guess_letter(state, letter, scoring=DEFAULT_SCORING):
+    """Guess a letter, ending the game if the guess wins or loses it.
+    Returns the result message"""
+    letter = letter.upper()
+    check_playable(state)
+
+    if not letter.isalpha() or not all(l in string.ascii_uppercase
+                                       for l in letter):
+        raise GameRuleError('Error, only letters from a-z are accepted')
+    if len(letter) > 1:
+        raise GameRuleError('Error, you can only choose one letter at a time.')
+    if state.guessed & letter_bit(letter):
+        raise GameRuleError(
+            'Sorry, you already tried that letter, please pick another.')
+
+    state.guessed |= letter_bit(letter)
+    state.mask, state.solution, count = apply_letter(
+        state.word, state.mask, state.solution, letter)
+
+    if not count:
+        state.misses_remaining -= 1
+        state.history.append((letter, 'Incorrect'))
+        if state.misses_remaining < 1:
+            _end(state, won=False)
+            return 'Sorry, that is incorrect and the game is now over.'
+        return 'Sorry, that is incorrect'
+
+    state.history.append((letter, 'Correct'))
+    if is_solved(state.word, state.mask):
+        state.score = scored(state.score, scoring, letters=count, words=1)
+        _end(state, won=True)
+        return 'Great Job, you won the game!'
+
+    state.score = scored(state.score, scoring, letters=count)
+    return 'Nice Job, the letter {} is in the secret word'.format(letter)
+
+
+def guess_word(state, word, scoring=DEFAULT_SCORING):
+    """Guess the secret word, ending the game if the guess wins or loses
+    it. Returns the result message"""
+    word = word.upper()
+    check_playable(state)
+
+    if not word.isalpha():
+        raise GameRuleError('Error, only letters from a-z are accepted')
+
+    if word != state.word:
+        state.misses_remaining -= 1
+        state.history.append((word, 'Incorrect'))
+        if state.misses_remaining < 1:
+            _end(state, won=False)
+            return 'Sorry, that was the wrong answer and the game is over'
+        return 'Sorry, that was not the correct answer'
+
+    state.score = scored(state.score, scoring,
+                         blanks=blanks(state.word, state.mask), words=1)
+    state.history.append((word, 'Correct'))
+    _end(state, won=True)
+    return 'Congratulations! you win!'
+
+
+def hint(state, letter, scoring=DEFAULT_SCORING):
+    """Record a hint of a letter, taking the hint penalty off the score.
+    Returns the result message"""
+    check_playable(state)
+    state.score = scored(state.score, scoring, hints=1)
+    state.history.append((letter, 'Hint'))
+    return 'Try the letter {}'.format(letter)
+
+
+def cancel(state):
+    """Cancel a game. Returns the result message"""
+    if state.over:
+        raise GameRuleError('This game is already over')
+    if state.cancelled:
+        raise GameRuleError('This game has already been cancelled')
+    state.cancelled = True
+    state.history.append(('', 'Game Cancelled'))
+    return 'The game has been cancelled'
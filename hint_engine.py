@@ -0,0 +1,163 @@
+"""hint_engine.py - Suggests the next letter to guess in a game.
+
+The best letter is the one that appears in the most dictionary words that
+are still possible given the current solution and the wrong guesses. To
+avoid scanning the dictionary for every hint, the words of each length are
+indexed once per instance: for every position and letter there is a bitset,
+a Python int with bit i set if word i of that length has the letter at that
+position. The candidate words of a game are then a handful of ANDs of these
+bitsets, and the number of candidates containing a letter is a popcount.
+Candidate sets and the resulting letter rankings are memoized per
+(pattern, wrong letters) state, which many games pass through.
+"""
+
+import binascii
+import string
+import threading
+
+from word_source import get_word_source
+
+# The memos of candidate sets and of letter rankings are cleared when they
+# reach these sizes. A candidate set of a large dictionary is an int of tens
+# of KB, a ranking is at most 26 pairs.
+MAX_MEMOIZED_CANDIDATES = 1000
+MAX_MEMOIZED_RANKINGS = 10000
+
+_lock = threading.Lock()
+_index = None
+
+
+def _bitset(numbers, size):
+    """Returns an int with the bits of a list of word indexes set"""
+    bitmap = bytearray((size + 7) // 8)
+    for number in numbers:
+        bitmap[number >> 3] |= 1 << (number & 7)
+    bitmap.reverse()
+    return int(binascii.hexlify(bitmap) or '0', 16)
+
+
+def count_bits(bits):
+    """Returns the number of set bits of an int"""
+    return bin(bits).count('1')
+
+
+class LengthIndex(object):
+    """The position and letter bitsets of the words of one length"""
+
+    def __init__(self, words):
+        self.words = words
+        self.length = len(words[0]) if words else 0
+        self.all = (1 << len(words)) - 1
+
+        positions = [dict((letter, []) for letter in string.ascii_uppercase)
+                     for _ in range(self.length)]
+        for number, word in enumerate(words):
+            for position, letter in enumerate(word):
+                positions[position][letter].append(number)
+        self.at = [dict((letter, _bitset(numbers, len(words)))
+                        for letter, numbers in found.items())
+                   for found in positions]
+        self.contains = dict(
+            (letter, reduce(lambda bits, at: bits | at[letter], self.at, 0))
+            for letter in string.ascii_uppercase)
+
+    def candidates(self, pattern, wrong_letters):
+        """Returns the bitset of the words matching a pattern, where '_' is
+        an unrevealed position, that contain none of the wrong letters"""
+        if len(pattern) != self.length:
+            # No dictionary word has the pattern's length
+            return 0
+        revealed = set(letter for letter in pattern if letter != '_')
+        bits = self.all
+        for letter in wrong_letters:
+            bits &= ~self.contains[letter]
+        for position, letter in enumerate(pattern):
+            if letter != '_':
+                bits &= self.at[position][letter]
+            else:
+                # A revealed letter shows all of its positions at once
+                for other in revealed:
+                    bits &= ~self.at[position][other]
+        return bits
+
+
+class HintIndex(object):
+    """LengthIndexes of a word source, built on first use"""
+
+    def __init__(self, source):
+        self.source = source
+        self._lengths = {}
+        self._candidates = {}
+        self._rankings = {}
+
+    def length_index(self, length):
+        """Returns the LengthIndex of the words of a length"""
+        index = self._lengths.get(length)
+        if index is None:
+            numbers = sorted(number
+                             for (bucket_length, _), bucket
+                             in self.source.buckets.items()
+                             if bucket_length == length
+                             for number in bucket)
+            index = LengthIndex([self.source.word(number)
+                                 for number in numbers])
+            with _lock:
+                self._lengths[length] = index
+        return index
+
+    @staticmethod
+    def _memoize(memo, size, state, value):
+        """Store a value in a memo, clearing it first if it is full"""
+        with _lock:
+            if len(memo) >= size:
+                memo.clear()
+            memo[state] = value
+
+    def candidates(self, pattern, wrong_letters):
+        """Returns the memoized candidate bitset of a game state"""
+        state = (pattern, ''.join(sorted(wrong_letters)))
+        bits = self._candidates.get(state)
+        if bits is None:
+            bits = self.length_index(len(pattern)).candidates(*state)
+            self._memoize(self._candidates, MAX_MEMOIZED_CANDIDATES, state,
+                          bits)
+        return bits
+
+    def rank_letters(self, pattern, guessed_letters):
+        """Returns a list of (candidate words containing the letter, letter)
+        for the letters not yet guessed, most candidates first, and the
+        number of candidate words"""
+        pattern = pattern.upper()
+        guessed = set(letter.upper() for letter in guessed_letters)
+        wrong = ''.join(sorted(guessed - set(pattern)))
+        result = self._rankings.get((pattern, wrong))
+        if result is None:
+            bits = self.candidates(pattern, wrong)
+            index = self.length_index(len(pattern))
+            ranking = sorted(
+                ((count_bits(bits & index.contains[letter]), letter)
+                 for letter in string.ascii_uppercase
+                 if letter not in guessed),
+                key=lambda item: (-item[0], item[1]))
+            result = (ranking, count_bits(bits))
+            self._memoize(self._rankings, MAX_MEMOIZED_RANKINGS,
+                          (pattern, wrong), result)
+        return result
+
+    def suggest(self, pattern, guessed_letters):
+        """Returns the best letter to guess next and the number of candidate
+        words, or (None, 0) if no dictionary word matches"""
+        ranking, total = self.rank_letters(pattern, guessed_letters)
+        if not total or not ranking or not ranking[0][0]:
+            return None, 0
+        return ranking[0][1], total
+
+
+def get_hint_index():
+    """Returns the instance's HintIndex over the word source"""
+    global _index
+    if _index is None:
+        with _lock:
+            if _index is None:
+                _index = HintIndex(get_word_source())
+    return _index
@@ -0,0 +1,56 @@
+"""history_codec.py - Compact encoding of game history and guessed letters.
+
+A game's history is stored as a packed byte string of records. Each record
+is a one byte result code, a two byte guess length and the UTF-8 bytes of the
+guess. Guessed letters are stored as a 26 bit mask, bit 0 being 'A'.
+"""
+
+import string
+import struct
+
+# New results are only ever appended, their codes are stored in games
+RESULTS = ['Correct', 'Incorrect', 'Game Won', 'Game Lost', 'Game Cancelled',
+           'Hint']
+RESULT_CODES = dict((result, code) for code, result in enumerate(RESULTS, 1))
+
+_HEADER = struct.Struct('>BH')
+
+
+def pack_history_item(guess, result):
+    """Returns the packed record of one history item"""
+    if result not in RESULT_CODES:
+        raise ValueError('Unknown history result: {}'.format(result))
+    guess = guess.encode('utf-8')
+    return _HEADER.pack(RESULT_CODES[result], len(guess)) + guess
+
+
+def unpack_history(data):
+    """Returns a list of (guess, result) tuples from packed records"""
+    items = []
+    offset = 0
+    while offset < len(data):
+        code, length = _HEADER.unpack_from(data, offset)
+        offset += _HEADER.size
+        guess = data[offset:offset + length].decode('utf-8')
+        offset += length
+        items.append((guess, RESULTS[code - 1]))
+    return items
+
+
+def letter_bit(letter):
+    """Returns the mask bit of an uppercase letter from A-Z"""
+    return 1 << (ord(letter) - ord('A'))
+
+
+def mask_letters(mask):
+    """Returns the letters set in a mask, in alphabetical order"""
+    return [letter for letter in string.ascii_uppercase
+            if mask & letter_bit(letter)]
+
+
+def letters_mask(letters):
+    """Returns the mask of a string of uppercase letters"""
+    mask = 0
+    for letter in letters:
+        mask |= letter_bit(letter)
+    return mask
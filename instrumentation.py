@@ -0,0 +1,124 @@
+"""instrumentation.py - Per-request API call counts and latency of endpoints.
+
+Endpoint methods decorated with `instrumented` count the datastore and
+memcache calls they make, through hooks on the API proxy, and time the
+controller call. Each request logs one JSON line, and a rolling window of
+recent requests is kept per endpoint for the `/_admin/stats` handler. The
+hooks only increment counters on the calling thread, so they can be left on
+under load.
+"""
+
+import functools
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+from google.appengine.api import apiproxy_stub_map
+
+from config import STATS_WINDOW
+
+HOOK_NAME = 'hangman_instrumentation'
+COUNTERS = ('datastore_rpcs', 'gets', 'puts', 'queries', 'memcache_rpcs',
+            'memcache_hits', 'memcache_misses')
+
+_local = threading.local()
+_lock = threading.Lock()
+_windows = {}
+
+
+def _counts():
+    """Returns the counters of the current request, or None outside one"""
+    return getattr(_local, 'counts', None)
+
+
+def _pre_call(service, call, request, response):
+    """Count a datastore or memcache call of the current request"""
+    counts = _counts()
+    if counts is None:
+        return
+    if service == 'datastore_v3':
+        counts['datastore_rpcs'] += 1
+        if call == 'Get':
+            counts['gets'] += request.key_size()
+        elif call == 'Put':
+            counts['puts'] += request.entity_size()
+        elif call == 'RunQuery':
+            counts['queries'] += 1
+    elif service == 'memcache':
+        counts['memcache_rpcs'] += 1
+
+
+def _post_call(service, call, request, response):
+    """Count the memcache hits and misses of the current request"""
+    counts = _counts()
+    if counts is None or service != 'memcache' or call != 'Get':
+        return
+    hits = response.item_size()
+    counts['memcache_hits'] += hits
+    counts['memcache_misses'] += request.key_size() - hits
+
+
+apiproxy_stub_map.apiproxy.GetPreCallHooks().Append(HOOK_NAME, _pre_call)
+apiproxy_stub_map.apiproxy.GetPostCallHooks().Append(HOOK_NAME, _post_call)
+
+
+def _record(name, sample):
+    """Add a request to the rolling window of its endpoint"""
+    with _lock:
+        window = _windows.get(name)
+        if window is None:
+            window = _windows[name] = deque(maxlen=STATS_WINDOW)
+        window.append(sample)
+
+
+def instrumented(method):
+    """Decorator for endpoint methods, put it below @endpoints.method"""
+    @functools.wraps(method)
+    def wrapper(self, request):
+        _local.counts = dict.fromkeys(COUNTERS, 0)
+        error = None
+        start = time.time()
+        try:
+            return method(self, request)
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            latency_ms = (time.time() - start) * 1000
+            counts = _local.counts
+            _local.counts = None
+            logging.info('endpoint_stats %s', json.dumps(dict(
+                counts, endpoint=method.__name__, latency_ms=latency_ms,
+                error=error), sort_keys=True))
+            _record(method.__name__, (latency_ms, counts, error))
+    return wrapper
+
+
+def _percentile(values, fraction):
+    """Returns a percentile of a sorted list of numbers"""
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summary():
+    """Returns a dict of each endpoint to the latency percentiles and
+    average call counts of its requests in the rolling window"""
+    with _lock:
+        windows = dict((name, list(window))
+                       for name, window in _windows.items())
+
+    endpoints_summary = {}
+    for name, samples in windows.items():
+        latencies = sorted(latency for latency, _, _ in samples)
+        averages = dict((counter, sum(counts[counter]
+                                      for _, counts, _ in samples) /
+                         float(len(samples)))
+                        for counter in COUNTERS)
+        endpoints_summary[name] = dict(averages,
+                                       requests=len(samples),
+                                       errors=sum(1 for _, _, error in samples
+                                                  if error),
+                                       p50_ms=_percentile(latencies, 0.5),
+                                       p99_ms=_percentile(latencies, 0.99))
+    return endpoints_summary
@@ -1,44 +1,105 @@
 #!/usr/bin/env python
 
 """main.py - This file contains handlers that are called by taskqueue and/or
-cronjobs."""
+cronjobs.
+
+The endpoints API is not imported here, and the modules the handlers use are
+imported when a handler first runs, so instances serving cron and task
+requests start quickly.
+"""
+
+import json
 
 import webapp2
-from google.appengine.api import mail, app_identity
-from api import HangmanAPI
+from google.appengine.api import taskqueue
 
-from models.user_model import User
-from models.game_model import Game
+import instrumentation
 
 
 class SendReminderEmail(webapp2.RequestHandler):
     def get(self):
         """Send a reminder email to users.
 
-        This handler will be called every hour using a cron job.
+        This handler will be called every day using a cron job.
         An email will only be sent to users that have active games, that is
-        games that are not 'over' or 'canceled'
+        games that are not 'over' or 'canceled'. The work is done by the
+        task chain in reminders.py.
         """
+        import reminders
+        reminders.start()
+
+
+class FindReminderRecipients(webapp2.RequestHandler):
+    def post(self):
+        """Check one page of users for active games"""
+        import reminders
+        reminders.find_recipients(self.request.get('day'),
+                                  self.request.get('cursor') or None)
+
+
+class SendReminderBatch(webapp2.RequestHandler):
+    def post(self):
+        """Send the reminder emails of one page of users"""
+        import reminders
+        batch = json.loads(self.request.body)
+        reminders.send(batch['day'], batch['recipients'])
+
+
+class StartJob(webapp2.RequestHandler):
+    def get(self, name):
+        """Start a job from migrations.py, called by cron jobs"""
+        from migrations import MIGRATIONS
+        if name not in MIGRATIONS:
+            self.abort(404)
+        taskqueue.add(url='/tasks/migrate/{}'.format(name))
+
 
-        app_id = app_identity.get_application_id()
-        users = User.query(User.email != None)
-
-        for user in users:
-            games = (
-                Game.query(ancestor=user.key)
-                .filter(Game.game_over == False)
-                .filter(Game.game_cancelled == False)
-                .fetch())
-            if games:
-                email_from = 'noreply@{}.appspotmail.com'.format(app_id)
-                email_to = user.email
-                email_subject = 'Have you given up on your game of Hangman?'
-                email_body = ('Hello {}, it\'s been awhile since you played'
-                              ' your game of hangman. why don\'t you come back'
-                              ' and play for awhile').format(user.user_name)
-                mail.send_mail(email_from, email_to, email_subject, email_body)
+class MigrationHandler(webapp2.RequestHandler):
+    def post(self, name):
+        """Run one batch of a migration and queue the next one.
+
+        Start a migration by POSTing to /tasks/migrate/<name>, the handler
+        re-queues itself with the returned cursor until the migration is done.
+        """
+        from migrations import MIGRATIONS
+        migration = MIGRATIONS.get(name)
+        if not migration:
+            self.abort(404)
+
+        cursor = migration(self.request.get('cursor') or None)
+        if cursor:
+            taskqueue.add(url='/tasks/migrate/{}'.format(name),
+                          params={'cursor': cursor})
+
+
+class UpdateLeaderboards(webapp2.RequestHandler):
+    def post(self):
+        """Add a won game's score to the leaderboards, queued by end_game"""
+        from google.appengine.ext import ndb
+        import response_cache
+        from models.leaderboard_model import Leaderboard
+        Leaderboard.add_win(ndb.Key(urlsafe=self.request.get('score')))
+        response_cache.bump(response_cache.SCORES, response_cache.RANKINGS)
+
+
+class AdminStats(webapp2.RequestHandler):
+    def get(self):
+        """Return this instance's rolling summary of endpoint requests and
+        its game cache counters"""
+        import game_cache
+        self.response.content_type = 'application/json'
+        self.response.write(json.dumps({
+            'endpoints': instrumentation.summary(),
+            'game_cache': game_cache.stats(),
+        }, indent=2, sort_keys=True))
 
 
 app = webapp2.WSGIApplication([
     ('/crons/send_reminder', SendReminderEmail),
+    ('/tasks/reminders/find', FindReminderRecipients),
+    ('/tasks/reminders/send', SendReminderBatch),
+    ('/crons/jobs/(\w+)', StartJob),
+    ('/tasks/migrate/(\w+)', MigrationHandler),
+    ('/tasks/leaderboards', UpdateLeaderboards),
+    ('/_admin/stats', AdminStats),
 ], debug=True)
@@ -0,0 +1,483 @@
+"""migrations.py - Batched data migrations and maintenance jobs.
+
+Each migration processes one batch of entities starting at a query cursor
+and returns the cursor to continue from, or None when it is done. The
+MigrationHandler in main.py runs them as a chain of task queue tasks.
+"""
+
+import logging
+from datetime import date
+
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+
+import game_cache
+import response_cache
+from config import LEADERBOARD_SIZE, ROOT_GAMES
+from models.user_model import User
+from models.game_model import (
+    Game,
+    GameKeyAlias,
+    GameArchive,
+    ArchivedGame,
+    ArchivedGameRef,
+)
+from models.score_model import Score
+from models.counter_model import UserScoreShard
+from models.stats_model import UserStats, UserStatsRebuild
+from models.leaderboard_model import (
+    Leaderboard,
+    LeaderboardEntry,
+    HIGH_SCORES,
+    USER_RANKINGS,
+)
+
+BATCH_SIZE = 100
+REKEY_BATCH_SIZE = 10
+STATS_BATCH_SIZE = 10
+
+# Games archived per transaction. A cross-group transaction can write at
+# most 25 entity groups, and with ROOT_GAMES each game is its own group.
+ARCHIVE_CHUNK_SIZE = 20
+
+# The archive_games job archives games matching each of these filters in turn
+ARCHIVE_FILTERS = (Game.status_filter(Game.OVER),
+                   Game.status_filter(Game.CANCELLED))
+
+# Prefix of the rekey_users cursor
+PAGE_PREFIX = 'page:'
+
+# Kinds re-put in turn by reindex_entities
+REINDEX_KINDS = (Game, User)
+
+
+def backfill_score_user_names(cursor=None):
+    """Copy the owning user's name onto Score entities that lack it"""
+    scores, next_cursor, more = Score.query().fetch_page(
+        BATCH_SIZE, start_cursor=Cursor(urlsafe=cursor) if cursor else None)
+
+    scores = [score for score in scores if not score.user_name]
+    user_keys = list(set(score.user for score in scores))
+    users = dict(zip(user_keys, ndb.get_multi(user_keys)))
+
+    to_put = []
+    for score in scores:
+        user = users.get(score.user)
+        if user:
+            score.user_name = user.user_name
+            to_put.append(score)
+    ndb.put_multi(to_put)
+    if to_put:
+        response_cache.bump(response_cache.SCORES)
+
+    if more and next_cursor:
+        return next_cursor.urlsafe()
+    return None
+
+
+def rebuild_leaderboards(cursor=None):
+    """Regenerate the leaderboards from the Score and User tables"""
+    scores = Score.query().order(-Score.score).fetch(LEADERBOARD_SIZE)
+    forms = Score.create_forms(scores).items
+    Leaderboard.rebuild(HIGH_SCORES, [
+        LeaderboardEntry(user_name=form.user_name,
+                         score=score.score,
+                         date=score.date,
+                         won=score.won,
+                         score_key=score.key)
+        for score, form in zip(scores, forms)])
+
+    users = User.query().order(-User.ranking_score).fetch(LEADERBOARD_SIZE)
+    totals = User.total_scores(users)
+    Leaderboard.rebuild(USER_RANKINGS, [
+        LeaderboardEntry(user_name=user.user_name, score=totals[user.key])
+        for user in users])
+    response_cache.bump(response_cache.SCORES, response_cache.RANKINGS)
+    return None
+
+
+def expire_leaderboards(cursor=None):
+    """Delete the shards of the daily and weekly high scores leaderboards
+    that have expired"""
+    keys, next_cursor, more = Leaderboard.expired_keys(
+        date.today(), BATCH_SIZE, Cursor(urlsafe=cursor) if cursor else None)
+    ndb.delete_multi(keys)
+    if keys:
+        response_cache.bump(response_cache.SCORES)
+
+    if more and next_cursor:
+        return next_cursor.urlsafe()
+    return None
+
+
+def sync_user_ranking_scores(cursor=None):
+    """Copy each user's counter total onto User.ranking_score"""
+    users, next_cursor, more = User.query().fetch_page(
+        BATCH_SIZE, start_cursor=Cursor(urlsafe=cursor) if cursor else None)
+
+    totals = User.total_scores(users)
+    changed = [user for user in users
+               if user.ranking_score != totals[user.key]]
+    for user in changed:
+        user.ranking_score = totals[user.key]
+    ndb.put_multi(changed)
+    if changed:
+        response_cache.bump(response_cache.RANKINGS)
+
+    if more and next_cursor:
+        return next_cursor.urlsafe()
+    return None
+
+
+def _name_twin(key):
+    """Returns the key of the other user whose shards had the same old names
+    as a user's, a numeric id and a user name of the same digits"""
+    if isinstance(key.id(), basestring):
+        return ndb.Key(User, int(key.id())) if key.id().isdigit() else None
+    return ndb.Key(User, unicode(key.id()))
+
+
+def rename_score_shards(cursor=None):
+    """Move the score counter shards of a batch of users from their old
+    names to names after the user's urlsafe key. A numeric id and a user
+    name of the same digits shared their old shards, those users are
+    skipped and logged"""
+    users, next_cursor, more = User.query().fetch_page(
+        REKEY_BATCH_SIZE, keys_only=True,
+        start_cursor=Cursor(urlsafe=cursor) if cursor else None)
+
+    twins = [_name_twin(key) for key in users]
+    found = ndb.get_multi([twin for twin in twins if twin])
+    existing = set(user.key for user in found if user)
+    for key, twin in zip(users, twins):
+        if twin in existing:
+            logging.warning('Not renaming the score shards of user %r, '
+                            'they were shared with user %r', key.id(),
+                            twin.id())
+            continue
+        UserScoreShard.move_old_shards(key)
+
+    if more and next_cursor:
+        return next_cursor.urlsafe()
+    return None
+
+
+def _move_game(old_key, new_key, user_key=None):
+    """Move a game to a new key, leaving an alias at its old key, in one
+    transaction. user_key is the game's new user, if it changes. Returns
+    False if the game no longer exists"""
+    @ndb.transactional(xg=True)
+    def move():
+        game = old_key.get()
+        if not game:
+            return False
+        values = game.to_dict(exclude=['status'])
+        if user_key:
+            values['user'] = user_key
+        ndb.put_multi([Game(key=new_key, **values),
+                       GameKeyAlias(key=GameKeyAlias.key_for(old_key),
+                                    game=new_key)])
+        old_key.delete()
+        return True
+
+    moved = move()
+    game_cache.evict([old_key])
+    return moved
+
+
+def _set_game_user(key, old_user_key, new_user_key):
+    """Change the user of a root game, in a transaction that moves its
+    version on, so a save from a copy read before fails instead of writing
+    the old user back"""
+    @ndb.transactional
+    def update():
+        game = key.get()
+        if game and game.user == old_user_key:
+            game.user = new_user_key
+            game.version += 1
+            game.put()
+
+    update()
+    game_cache.evict([key])
+
+
+def _move_user_games(old_key, new_key):
+    """Move one batch of a user's games. Returns True once none are left"""
+    keys = Game.query(ancestor=old_key).fetch(BATCH_SIZE, keys_only=True)
+    for key in keys:
+        _move_game(key, ndb.Key(Game, key.id(), parent=new_key), new_key)
+    if len(keys) == BATCH_SIZE:
+        return False
+
+    # Root games only need their user property changed
+    keys = Game.query(Game.user == old_key).fetch(BATCH_SIZE, keys_only=True)
+    keys = [key for key in keys if not key.parent()]
+    for key in keys:
+        _set_game_user(key, old_key, new_key)
+    return len(keys) < BATCH_SIZE
+
+
+def _move_user_scores(old_key, new_key):
+    """Move one batch of a user's scores and archives, which are not changed
+    once written. Returns True once none are left"""
+    scores = Score.query(Score.user == old_key).fetch(BATCH_SIZE)
+    for score in scores:
+        score.user = new_key
+    ndb.put_multi(scores)
+
+    archives = GameArchive.query(GameArchive.user == old_key).fetch(
+        BATCH_SIZE)
+    for archive in archives:
+        archive.user = new_key
+    ndb.put_multi(archives)
+    return len(scores) < BATCH_SIZE and len(archives) < BATCH_SIZE
+
+
+def _move_user(user):
+    """Move one batch of a user with a numeric id to the key of its user
+    name, along with its games, scores and score counter. Each game is moved
+    in its own transaction. Returns True once the user has been moved, and
+    is safe to run again until then"""
+    old_key = user.key
+    new_key = User.key_for(user.user_name)
+    existing = new_key.get()
+    if existing and existing.user_name != user.user_name:
+        logging.warning('Not moving user %s, the key %s belongs to %s',
+                        old_key.id(), new_key.id(), existing.user_name)
+        return True
+    if not existing:
+        User(key=new_key,
+             **user.to_dict(exclude=['normalized_name'])).put()
+
+    if not (_move_user_games(old_key, new_key) and
+            _move_user_scores(old_key, new_key)):
+        return False
+
+    UserScoreShard.move(old_key, new_key)
+    UserStats.move(old_key, new_key)
+    old_key.delete()
+    return True
+
+
+def rekey_users(cursor=None):
+    """Move users with numeric ids to keys of their user names. A user with
+    more than a batch of games or scores is moved over several tasks, which
+    re-read the same page of users until it is done. The cursor is the
+    query cursor of the page, after a prefix so the first page has one"""
+    page = cursor or ''
+    if page.startswith(PAGE_PREFIX):
+        page = page[len(PAGE_PREFIX):]
+    users, next_cursor, more = User.query().fetch_page(
+        REKEY_BATCH_SIZE,
+        start_cursor=Cursor(urlsafe=page) if page else None)
+
+    for user in users:
+        if not isinstance(user.key.id(), basestring) and not _move_user(user):
+            return PAGE_PREFIX + page
+
+    if more and next_cursor:
+        return PAGE_PREFIX + next_cursor.urlsafe()
+    return None
+
+
+def _rebuild_user_stats(user):
+    """Count one batch of a user's games, or of its archives, into the
+    user's stats rebuild. Games added to the stats since the rebuild started
+    are left out, they are in the stats already. Returns True once the
+    rebuild is finished and added to the stats"""
+    rebuild = UserStatsRebuild.key_for(user.key).get()
+    if not rebuild:
+        rebuild = UserStats.start_rebuild(user.key, user.user_name)
+    start_cursor = Cursor(urlsafe=rebuild.cursor) if rebuild.cursor else None
+
+    if rebuild.phase == 'games':
+        keys, next_cursor, more = Game.query_user_games(user.key).fetch_page(
+            BATCH_SIZE, keys_only=True, start_cursor=start_cursor)
+        games = [game for game in ndb.get_multi(keys)
+                 if game and (game.game_cancelled or game.game_over)]
+    else:
+        archives, next_cursor, more = GameArchive.query(
+            GameArchive.user == user.key).fetch_page(
+                STATS_BATCH_SIZE, start_cursor=start_cursor)
+        games = [archived.to_game(user.key)
+                 for archive in archives for archived in archive.games]
+
+    # Read after the games, so a game seen ended after the rebuild started
+    # is already listed
+    stats = UserStats.key_for(user.key).get(use_cache=False,
+                                            use_memcache=False)
+    added = set(stats.rebuild_games) if stats else set()
+    for game in games:
+        if game.key not in added:
+            rebuild.add_game(game, won=game.game_over and game.is_solved())
+
+    if more and next_cursor:
+        rebuild.cursor = next_cursor.urlsafe()
+    elif rebuild.phase == 'games':
+        rebuild.phase, rebuild.cursor = 'archives', None
+    else:
+        UserStats.finish_rebuild(rebuild)
+        return True
+    rebuild.put()
+    return False
+
+
+def rebuild_user_stats(cursor=None):
+    """Recompute the UserStats of a batch of users from their games, up to
+    STATS_BATCH_SIZE batches of games per task. A user with more games is
+    rebuilt over several tasks. The cursor is the index of the user being
+    rebuilt and the query cursor of the page of users"""
+    index, _, page = (cursor or '0:').partition(':')
+    users, next_cursor, more = User.query().fetch_page(
+        STATS_BATCH_SIZE,
+        start_cursor=Cursor(urlsafe=page) if page else None)
+
+    batches = 0
+    for number in range(int(index), len(users)):
+        while not _rebuild_user_stats(users[number]):
+            batches += 1
+            if batches >= STATS_BATCH_SIZE:
+                return '{}:{}'.format(number, page)
+
+    if more and next_cursor:
+        return '0:{}'.format(next_cursor.urlsafe())
+    return None
+
+
+def _archive_user_games(user_key, game_keys):
+    """Move a user's finished games into a new GameArchive chunk and delete
+    them, in one transaction. Games that were already archived are skipped.
+    Returns the keys of the archived games"""
+    @ndb.transactional(xg=True)
+    def archive():
+        games = [game for game in ndb.get_multi(game_keys)
+                 if game and (game.game_over or game.game_cancelled)]
+        if not games:
+            return []
+        archive_key = GameArchive(
+            id=games[0].key.urlsafe(),
+            user=user_key,
+            game_keys=[game.key for game in games],
+            games=[ArchivedGame.from_game(game) for game in games]).put()
+        # The references are in the games' entity groups, so they don't add
+        # groups to the transaction
+        ndb.put_multi([ArchivedGameRef(key=ArchivedGameRef.key_for(game.key),
+                                       archive=archive_key)
+                       for game in games])
+        ndb.delete_multi([game.key for game in games])
+        return [game.key for game in games]
+
+    archived = archive()
+    game_cache.evict(archived)
+    return archived
+
+
+def archive_games(cursor=None):
+    """Move a batch of finished and cancelled games out of their users'
+    entity groups into GameArchive chunks of up to ARCHIVE_CHUNK_SIZE games
+    of one user.
+    The cursor is the index of the filter being archived and the query
+    cursor within it"""
+    phase, _, page = (cursor or '0:').partition(':')
+    phase = int(phase)
+    games, next_cursor, more = Game.query(ARCHIVE_FILTERS[phase]).fetch_page(
+        BATCH_SIZE, start_cursor=Cursor(urlsafe=page) if page else None)
+
+    by_user = {}
+    for game in games:
+        by_user.setdefault(game.user, []).append(game.key)
+    for user_key, game_keys in by_user.items():
+        for start in range(0, len(game_keys), ARCHIVE_CHUNK_SIZE):
+            _archive_user_games(user_key,
+                                game_keys[start:start + ARCHIVE_CHUNK_SIZE])
+
+    if more and next_cursor:
+        return '{}:{}'.format(phase, next_cursor.urlsafe())
+    if phase + 1 < len(ARCHIVE_FILTERS):
+        return '{}:'.format(phase + 1)
+    return None
+
+
+def add_archived_game_refs(cursor=None):
+    """Write the ArchivedGameRef of every game in a batch of GameArchive
+    chunks, for the chunks archived before games were looked up by key"""
+    archives, next_cursor, more = GameArchive.query().fetch_page(
+        BATCH_SIZE, start_cursor=Cursor(urlsafe=cursor) if cursor else None)
+
+    ndb.put_multi([ArchivedGameRef(key=ArchivedGameRef.key_for(key),
+                                   archive=archive.key)
+                   for archive in archives for key in archive.game_keys])
+
+    if more and next_cursor:
+        return next_cursor.urlsafe()
+    return None
+
+
+def reparent_games(cursor=None):
+    """Move the games stored in their user's entity group to root keys.
+    Only runs with ROOT_GAMES set, so that no new games are created in the
+    users' entity groups meanwhile"""
+    if not ROOT_GAMES:
+        logging.warning('Not reparenting games, ROOT_GAMES is not set')
+        return None
+
+    keys, next_cursor, more = Game.query().fetch_page(
+        REKEY_BATCH_SIZE, keys_only=True,
+        start_cursor=Cursor(urlsafe=cursor) if cursor else None)
+
+    keys = [key for key in keys if key.parent()]
+    if keys:
+        first, _ = Game.allocate_ids(size=len(keys))
+        for offset, key in enumerate(keys):
+            _move_game(key, ndb.Key(Game, first + offset))
+
+    if more and next_cursor:
+        return next_cursor.urlsafe()
+    return None
+
+
+def _reput(key):
+    """Put an entity again unchanged, in a transaction so a concurrent
+    write isn't overwritten"""
+    @ndb.transactional
+    def reput():
+        entity = key.get()
+        if entity:
+            entity.put()
+    reput()
+
+
+def reindex_entities(cursor=None):
+    """Put every game and user again, so their index rows match the
+    current indexed properties and every game has a status.
+    The cursor is the index of the kind being re-put and the query cursor
+    within it"""
+    phase, _, page = (cursor or '0:').partition(':')
+    phase = int(phase)
+    keys, next_cursor, more = REINDEX_KINDS[phase].query().fetch_page(
+        BATCH_SIZE, keys_only=True,
+        start_cursor=Cursor(urlsafe=page) if page else None)
+
+    for key in keys:
+        _reput(key)
+
+    if more and next_cursor:
+        return '{}:{}'.format(phase, next_cursor.urlsafe())
+    if phase + 1 < len(REINDEX_KINDS):
+        return '{}:'.format(phase + 1)
+    return None
+
+
+MIGRATIONS = {
+    'backfill_score_user_names': backfill_score_user_names,
+    'rebuild_leaderboards': rebuild_leaderboards,
+    'expire_leaderboards': expire_leaderboards,
+    'sync_user_ranking_scores': sync_user_ranking_scores,
+    'rename_score_shards': rename_score_shards,
+    'rekey_users': rekey_users,
+    'rebuild_user_stats': rebuild_user_stats,
+    'archive_games': archive_games,
+    'add_archived_game_refs': add_archived_game_refs,
+    'reparent_games': reparent_games,
+    'reindex_entities': reindex_entities,
+}
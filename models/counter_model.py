@@ -0,0 +1,136 @@
+import random
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+from config import USER_SCORE_SHARDS
+
+# How long a summed total is trusted in memcache before being re-read
+TOTAL_CACHE_SECONDS = 60
+
+
+class UserScoreShard(ndb.Model):
+    """One shard of a user's total score counter.
+
+    Shards are root entities so that increments to different shards never
+    contend with each other or with the User entity.
+    """
+    count = ndb.IntegerProperty(default=0, indexed=False)
+
+    @staticmethod
+    def shard_keys(user_key):
+        """Returns the keys of all the shards of a user's counter. They are
+        named after the user's urlsafe key, which is ASCII and tells a
+        numeric id apart from a user name of the same digits"""
+        return [ndb.Key(UserScoreShard,
+                        '{}-{}'.format(user_key.urlsafe(), shard))
+                for shard in range(USER_SCORE_SHARDS)]
+
+    @staticmethod
+    def old_shard_keys(user_key):
+        """Returns the keys of a user's shards as they were named before
+        shard_keys used the urlsafe key, see move_old_shards"""
+        return [ndb.Key(UserScoreShard,
+                        u'{}-{}'.format(user_key.id(), shard))
+                for shard in range(USER_SCORE_SHARDS)]
+
+    @staticmethod
+    def cache_key(user_key):
+        """Returns the memcache key of a user's cached total"""
+        return 'user_score:{}'.format(user_key.urlsafe())
+
+    @classmethod
+    @ndb.tasklet
+    def increment_async(cls, user_key, amount):
+        """Add amount to a random shard of a user's counter. Must be called
+        inside a transaction, call increment_cached_total once it commits"""
+        key = random.choice(cls.shard_keys(user_key))
+        shard = yield key.get_async()
+        shard = shard or cls(key=key)
+        shard.count += amount
+        yield shard.put_async()
+
+    @classmethod
+    def increment_cached_total(cls, user_key, amount):
+        """Add amount to the user's cached total, if it is cached"""
+        if amount < 0:
+            # memcache can't add a negative delta, and its decr stops at 0,
+            # so the total is re-read from the shards instead
+            memcache.delete(cls.cache_key(user_key))
+        else:
+            memcache.incr(cls.cache_key(user_key), delta=amount)
+
+    @classmethod
+    def get_totals(cls, user_keys):
+        """Returns a dict of user key to the summed count of its shards"""
+        cache_keys = dict((cls.cache_key(key), key) for key in user_keys)
+        cached = memcache.get_multi(cache_keys.keys())
+        totals = dict((cache_keys[k], v) for k, v in cached.items())
+
+        missing = [key for key in user_keys if key not in totals]
+        if missing:
+            shard_keys = [cls.shard_keys(key) for key in missing]
+            shards = ndb.get_multi([k for keys in shard_keys for k in keys])
+            for index, user_key in enumerate(missing):
+                user_shards = shards[index * USER_SCORE_SHARDS:
+                                     (index + 1) * USER_SCORE_SHARDS]
+                totals[user_key] = sum(s.count for s in user_shards if s)
+            memcache.add_multi(
+                dict((cls.cache_key(key), totals[key]) for key in missing),
+                time=TOTAL_CACHE_SECONDS)
+        return totals
+
+    @classmethod
+    def _merge(cls, old_keys, new_keys):
+        """Add the counts of shards to the shards of new keys and delete
+        them, in one transaction. The old and new shards are
+        2 * USER_SCORE_SHARDS entity groups"""
+        @ndb.transactional(xg=True)
+        def merge():
+            shards = ndb.get_multi(old_keys + new_keys)
+            moved = []
+            for new_key, old, new in zip(new_keys, shards[:len(old_keys)],
+                                         shards[len(old_keys):]):
+                if old:
+                    new = new or cls(key=new_key)
+                    new.count += old.count
+                    moved.append(new)
+            ndb.put_multi(moved)
+            ndb.delete_multi([shard.key for shard in shards[:len(old_keys)]
+                              if shard])
+        merge()
+
+    @classmethod
+    def move(cls, old_user_key, new_user_key):
+        """Move a user's counter to a new user key, including shards that
+        still have their old names"""
+        new_keys = cls.shard_keys(new_user_key)
+        cls._merge(cls.old_shard_keys(old_user_key), new_keys)
+        cls._merge(cls.shard_keys(old_user_key), new_keys)
+        memcache.delete_multi([cls.cache_key(old_user_key),
+                               cls.cache_key(new_user_key)])
+
+    @classmethod
+    def move_old_shards(cls, user_key):
+        """Move a user's shards with their old names to the current ones"""
+        cls._merge(cls.old_shard_keys(user_key), cls.shard_keys(user_key))
+        memcache.delete(cls.cache_key(user_key))
+
+    @classmethod
+    @ndb.tasklet
+    def get_total_async(cls, user_key):
+        """Returns a future for the summed count of a user's shards"""
+        context = ndb.get_context()
+        cache_key = cls.cache_key(user_key)
+        total = yield context.memcache_get(cache_key)
+        if total is None:
+            shards = yield ndb.get_multi_async(cls.shard_keys(user_key))
+            total = sum(shard.count for shard in shards if shard)
+            yield context.memcache_add(cache_key, total,
+                                       time=TOTAL_CACHE_SECONDS)
+        raise ndb.Return(total)
+
+    @classmethod
+    def get_total(cls, user_key):
+        """Returns the summed count of a user's shards"""
+        return cls.get_totals([user_key])[user_key]
@@ -5,99 +5,387 @@ import endpoints
 from protorpc import messages
 from google.appengine.ext import ndb
 
-from utils import get_by_urlsafe
-from config import LETTER_POINT, WORD_POINT, BLANK_POINT
+import game_cache
+import game_engine
+from utils import key_from_urlsafe
+from config import ROOT_GAMES, GAME_STATUS_QUERIES
+from history_codec import (
+    pack_history_item,
+    unpack_history,
+    letter_bit,
+    letters_mask,
+    mask_letters,
+)
+
+
+# Games can be moved by rekey_users and then again by reparent_games
+MAX_ALIAS_HOPS = 2
 
 
 class Game(ndb.Model):
-    """A Game object"""
+    """A Game object.
+
+    Games are cached by game_cache, so ndb's own memcache caching is turned
+    off for them. Always write a game with save() so the cache stays current.
+
+    Games are created in their user's entity group, or as root entities if
+    config.ROOT_GAMES is set. Use query_user_games to find a user's games.
+
+    The history and guessed letters are stored in the compact history_data
+    and letters_mask fields, see history_codec. Games written before those
+    fields existed use history and letters_guessed, which are still read and
+    are moved to the compact fields the next time the game is saved.
+
+    Only user and status are queried, so the other properties are unindexed
+    and a save only writes index rows when the game's status changes.
+    """
+    _use_memcache = False
+
+    ACTIVE = 'active'
+    OVER = 'over'
+    CANCELLED = 'cancelled'
+
     user                = ndb.KeyProperty(required=True, kind='User')
-    misses_allowed      = ndb.IntegerProperty(required=True)
-    misses_remaining    = ndb.IntegerProperty(required=True)
-    letters_guessed     = ndb.StringProperty(default='')
-    game_over           = ndb.BooleanProperty(required=True, default=False)
-    game_cancelled      = ndb.BooleanProperty(required=True, default=False)
-    secret_word         = ndb.StringProperty(required=True)
-    current_solution    = ndb.StringProperty(required=True)
-    score               = ndb.IntegerProperty(required=True, default=0)
+    misses_allowed      = ndb.IntegerProperty(required=True, indexed=False)
+    misses_remaining    = ndb.IntegerProperty(required=True, indexed=False)
+    letters_guessed     = ndb.StringProperty(default='', indexed=False)
+    letters_mask        = ndb.IntegerProperty(default=0, indexed=False)
+    game_over           = ndb.BooleanProperty(required=True, default=False,
+                                              indexed=not GAME_STATUS_QUERIES)
+    game_cancelled      = ndb.BooleanProperty(required=True, default=False,
+                                              indexed=not GAME_STATUS_QUERIES)
+    secret_word         = ndb.StringProperty(required=True, indexed=False)
+    current_solution    = ndb.StringProperty(required=True, indexed=False)
+    revealed_mask       = ndb.IntegerProperty(indexed=False)
+    score               = ndb.IntegerProperty(required=True, default=0,
+                                              indexed=False)
     history             = ndb.JsonProperty(repeated=True)
+    history_data        = ndb.BlobProperty(default='')
+    version             = ndb.IntegerProperty(default=0, indexed=False)
+    status              = ndb.ComputedProperty(
+        lambda game: game.get_status())
 
 
     @classmethod
     def create_game(cls, user, misses_allowed, secret_word, current_solution):
         """Creates and returns a new game"""
-        game = cls(parent=user,
+        game = cls(parent=None if ROOT_GAMES else user,
                     user=user,
                     misses_allowed=misses_allowed,
                     misses_remaining=misses_allowed,
                     secret_word=secret_word,
-                    current_solution=current_solution)
-        game.put()
+                    current_solution=current_solution,
+                    revealed_mask=game_engine.mask_from_solution(
+                        current_solution))
+        game.save()
         return game
 
 
     @classmethod
     def get_game(cls, key):
         """Returns a GameStateForm"""
-        game = get_by_urlsafe(key, cls)
+        game = game_cache.get(key, cls)
+        if not game:
+            old_key = key_from_urlsafe(key)
+            game_key = GameKeyAlias.resolve([old_key])[0]
+            if game_key != old_key:
+                game = game_cache.get(game_key.urlsafe(), cls)
+            if not game:
+                game = GameArchive.find_games([game_key])[0]
         if game:
             return game
         else:
             raise endpoints.NotFoundException('No Game Found')
 
 
-    def game_state(self, message=''):
-        """Returns the state of a game"""
+    @classmethod
+    def get_games(cls, keys):
+        """Returns the games of a list of keys, None for keys with no game"""
+        games = game_cache.get_multi(keys)
+        missing = [key for key, game in zip(keys, games) if game is None]
+        if missing:
+            resolved = dict(zip(missing, GameKeyAlias.resolve(missing)))
+            moved = [resolved[key] for key in missing if resolved[key] != key]
+            found = dict(zip(moved, game_cache.get_multi(moved)))
+            archived = [resolved[key] for key in missing
+                        if found.get(resolved[key]) is None]
+            if archived:
+                found.update(zip(archived, GameArchive.find_games(archived)))
+            games = [game or found.get(resolved.get(key))
+                     for key, game in zip(keys, games)]
+        return games
+
+
+    @classmethod
+    def query_user_games(cls, user_key):
+        """Returns a query of a user's games. With ROOT_GAMES set it queries
+        the user property, which also finds the games still stored in the
+        user's entity group"""
+        if ROOT_GAMES:
+            return cls.query(cls.user == user_key)
+        return cls.query(ancestor=user_key)
+
+
+    @classmethod
+    def status_filter(cls, status):
+        """Returns the query filter of the games with a status. Without
+        GAME_STATUS_QUERIES it filters on game_over and game_cancelled"""
+        if GAME_STATUS_QUERIES:
+            return cls.status == status
+        if status == cls.OVER:
+            return cls.game_over == True
+        if status == cls.CANCELLED:
+            return cls.game_cancelled == True
+        return ndb.AND(cls.game_cancelled == False, cls.game_over == False)
+
+
+    def get_status(self):
+        """Returns whether the game is active, over or cancelled"""
+        if self.game_cancelled:
+            return self.CANCELLED
+        if self.game_over:
+            return self.OVER
+        return self.ACTIVE
+
+
+    def game_state(self, message='', user=None):
+        """Returns the state of a game, user is the game's User if the caller
+        already has it"""
         state = GameStateForm()
         state.urlsafe_game_key = self.key.urlsafe()
-        state.user_name = self.user.get().user_name
+        state.user_name = (user or self.user.get()).user_name
         state.misses_remaining = self.misses_remaining
         state.message = message
         state.current_solution = list(self.current_solution)
-        state.letters_guessed = list(self.letters_guessed)
+        state.letters_guessed = self.guessed_letters()
         state.game_over = self.game_over
         state.game_cancelled = self.game_cancelled
         state.score = self.score
         return state
 
 
-    def decrement_misses_remaining(self):
-        """Decrement the misses remaining property"""
-        self.misses_remaining -=1
+    def save(self, in_transaction=None):
+        """Write the game through the game cache, see game_cache.save"""
+        game_cache.save(self, in_transaction)
 
 
-    def update_letters_guessed(self, letter):
-        """Update the letter_guessed property"""
-        self.letters_guessed = self.letters_guessed + letter
+    def get_revealed_mask(self):
+        """Returns the mask of the revealed positions of the secret word"""
+        if self.revealed_mask is None:
+            return game_engine.mask_from_solution(self.current_solution)
+        return self.revealed_mask
+
+
+    def engine_state(self):
+        """Returns the game's rules state, see game_engine.GameState"""
+        return game_engine.GameState(
+            self.secret_word, self.misses_remaining,
+            mask=self.get_revealed_mask(),
+            solution=self.current_solution,
+            guessed=letters_mask([l for l in self.guessed_letters()
+                                  if 'A' <= l <= 'Z']),
+            score=self.score,
+            over=self.game_over,
+            cancelled=self.game_cancelled)
+
+
+    def apply_engine_state(self, state):
+        """Copy a rules state back to the game, adding the history items of
+        the moves made on it"""
+        self.revealed_mask = state.mask
+        self.current_solution = state.solution
+        self.misses_remaining = state.misses_remaining
+        self.letters_mask = state.guessed
+        self.letters_guessed = ''
+        self.score = state.score
+        self.game_over = state.over
+        self.game_cancelled = state.cancelled
+        for guess, result in state.history:
+            self.update_history(guess, result)
+        state.history = []
+
+
+    def is_solved(self):
+        """Returns True if every letter of the secret word is revealed"""
+        return game_engine.is_solved(self.secret_word,
+                                     self.get_revealed_mask())
 
 
-    def update_score(self, blanks=0, letters=0, words=0):
-        """Updates the score property"""
-        points = 0
-        points += letters * LETTER_POINT
-        points += words * WORD_POINT
-        points += blanks * BLANK_POINT
-        self.score += points
+    def guessed_letters(self):
+        """Returns a list of the guessed letters"""
+        letters = set(mask_letters(self.letters_mask))
+        letters.update(self.letters_guessed)
+        return sorted(letters)
+
+
+    def update_letters_guessed(self, letter):
+        """Update the letters_mask property"""
+        self.letters_mask |= letter_bit(letter)
 
 
     def update_history(self, guess='', result=''):
-        """Updates the history property"""
-        item = json.dumps({'guess': guess, 'result': result})
-        self.history.append(item)
+        """Updates the history_data property"""
+        self.history_data = ((self.history_data or '') +
+                             pack_history_item(guess, result))
+
+
+    def history_items(self):
+        """Returns a list of (guess, result) tuples, oldest first"""
+        items = []
+        for item in self.history:
+            item = json.loads(item)
+            items.append((item.get('guess'), item.get('result')))
+        items.extend(unpack_history(self.history_data or ''))
+        return items
+
+
+    def guess_count(self):
+        """Returns the number of guesses made in the game"""
+        return sum(1 for guess, result in self.history_items()
+                   if guess and result != 'Hint')
 
 
     def create_history_form(self):
         """Creates and returns a history form"""
-        history_items = [json.loads(item) for item in self.history]
-
         history_form_items = []
-        for item in history_items:
-            history_form_items.append(GameHistoryForm(guess=item.get('guess'),
-                                                      result=item.get('result')))
+        for guess, result in self.history_items():
+            history_form_items.append(GameHistoryForm(guess=guess,
+                                                      result=result))
 
         return GameHistoryForms(history=history_form_items)
 
 
+    def _pre_put_hook(self):
+        """Move an old format game to the compact fields"""
+        if self.letters_guessed:
+            self.letters_mask |= letters_mask(
+                [l for l in self.letters_guessed if 'A' <= l <= 'Z'])
+            self.letters_guessed = ''
+        if self.history:
+            self.history_data = ''.join(
+                pack_history_item(guess, result)
+                for guess, result in self.history_items())
+            self.history = []
+
+
+class GameKeyAlias(ndb.Model):
+    """Points the key of a game that was moved to its new key, so old
+    urlsafe game keys keep working"""
+    game = ndb.KeyProperty(required=True, kind='Game', indexed=False)
+
+    @staticmethod
+    def key_for(old_key):
+        """Returns the key of the alias of a game's old key"""
+        return ndb.Key(GameKeyAlias, old_key.urlsafe())
+
+    @classmethod
+    def resolve(cls, keys):
+        """Returns the current key of each of a list of game keys, following
+        aliases of games that were moved more than once"""
+        resolved = list(keys)
+        pending = range(len(keys))
+        for _ in range(MAX_ALIAS_HOPS):
+            if not pending:
+                break
+            aliases = ndb.get_multi([cls.key_for(resolved[index])
+                                     for index in pending])
+            found = [(index, alias) for index, alias in zip(pending, aliases)
+                     if alias]
+            for index, alias in found:
+                resolved[index] = alias.game
+            pending = [index for index, _ in found]
+        return resolved
+
+
+class ArchivedGame(ndb.Model):
+    """The fields of a finished or cancelled game kept in a GameArchive"""
+    game             = ndb.KeyProperty(required=True, kind='Game')
+    misses_allowed   = ndb.IntegerProperty()
+    misses_remaining = ndb.IntegerProperty()
+    letters_mask     = ndb.IntegerProperty()
+    game_cancelled   = ndb.BooleanProperty()
+    secret_word      = ndb.StringProperty()
+    revealed_mask    = ndb.IntegerProperty()
+    score            = ndb.IntegerProperty()
+    history_data     = ndb.BlobProperty()
+
+    @classmethod
+    def from_game(cls, game):
+        """Returns the ArchivedGame of a game, in the compact format"""
+        return cls(game=game.key,
+                   misses_allowed=game.misses_allowed,
+                   misses_remaining=game.misses_remaining,
+                   letters_mask=letters_mask(''.join(game.guessed_letters())),
+                   game_cancelled=game.game_cancelled,
+                   secret_word=game.secret_word,
+                   revealed_mask=game.get_revealed_mask(),
+                   score=game.score,
+                   history_data=''.join(
+                       pack_history_item(guess, result)
+                       for guess, result in game.history_items()))
+
+    def to_game(self, user):
+        """Returns the archived game as a Game, which must not be saved"""
+        solution = ''.join(letter if self.revealed_mask & (1 << position)
+                           else '_'
+                           for position, letter in enumerate(self.secret_word))
+        return Game(key=self.game,
+                    user=user,
+                    misses_allowed=self.misses_allowed,
+                    misses_remaining=self.misses_remaining,
+                    letters_mask=self.letters_mask,
+                    game_over=not self.game_cancelled,
+                    game_cancelled=self.game_cancelled,
+                    secret_word=self.secret_word,
+                    current_solution=solution,
+                    revealed_mask=self.revealed_mask,
+                    score=self.score,
+                    history_data=self.history_data)
+
+
+class ArchivedGameRef(ndb.Model):
+    """Points the key of an archived game to its GameArchive. It is a child
+    of the game's key, so it is in the game's entity group and is written in
+    the transaction that deletes the game"""
+    archive = ndb.KeyProperty(required=True, kind='GameArchive',
+                              indexed=False)
+
+    @staticmethod
+    def key_for(game_key):
+        """Returns the key of the reference of an archived game's key"""
+        return ndb.Key(ArchivedGameRef, 1, parent=game_key)
+
+
+class GameArchive(ndb.Model):
+    """A chunk of a user's finished and cancelled games, moved out of the
+    user's entity group by the archive_games job. Archived games are found
+    by key through their ArchivedGameRef and served read only"""
+    user      = ndb.KeyProperty(required=True, kind='User')
+    game_keys = ndb.KeyProperty(kind='Game', repeated=True)
+    games     = ndb.LocalStructuredProperty(ArchivedGame, repeated=True,
+                                            compressed=True)
+
+    @classmethod
+    def find_games(cls, keys):
+        """Returns the archived Games of a list of game keys, None for keys
+        that are not archived"""
+        refs = ndb.get_multi([ArchivedGameRef.key_for(key) for key in keys])
+        archive_keys = list(set(ref.archive for ref in refs if ref))
+        archives = dict(zip(archive_keys, ndb.get_multi(archive_keys)))
+        games = []
+        for key, ref in zip(keys, refs):
+            archive = ref and archives.get(ref.archive)
+            games.append(archive.get_game(key) if archive else None)
+        return games
+
+    def get_game(self, key):
+        """Returns an archived game of this chunk as a Game"""
+        for archived in self.games:
+            if archived.game == key:
+                return archived.to_game(self.user)
+        return None
+
+
 class GameStateForm(messages.Message):
     """Outbound game state information"""
     urlsafe_game_key = messages.StringField(1, required=True)
@@ -111,15 +399,37 @@ class GameStateForm(messages.Message):
     score = messages.IntegerField(9)
 
 
+class HintForm(messages.Message):
+    """Outbound, the suggested next letter of a game"""
+    letter = messages.StringField(1, required=True)
+    candidate_words = messages.IntegerField(2, required=True)
+    state = messages.MessageField(GameStateForm, 3, required=True)
+
+
+class GameErrorForm(messages.Message):
+    """Outbound, why the state of a requested game couldn't be returned"""
+    urlsafe_game_key = messages.StringField(1, required=True)
+    error = messages.StringField(2, required=True)
+
+
 class GameStateForms(messages.Message):
     """Outbound, create multiple instances of GameStateForm"""
     items = messages.MessageField(GameStateForm, 1, repeated=True)
+    next_cursor = messages.StringField(2)
+    errors = messages.MessageField(GameErrorForm, 3, repeated=True)
+
+
+class GameKeysForm(messages.Message):
+    """Inbound, used to request the state of several games"""
+    urlsafe_game_keys = messages.StringField(1, repeated=True)
 
 
 class CreateGameForm(messages.Message):
     """Inbound, used to create a new game"""
     user_name = messages.StringField(1, required=True)
     misses_allowed = messages.StringField(2)
+    word_length = messages.IntegerField(3)
+    difficulty = messages.StringField(4)
 
 
 class GuessLetterForm(messages.Message):
@@ -132,6 +442,31 @@ class GuessWordForm(messages.Message):
     word_guess = messages.StringField(1, required=True)
 
 
+class GuessForm(messages.Message):
+    """Inbound, a letter or word guess of a batch of guesses"""
+    letter_guess = messages.StringField(1)
+    word_guess = messages.StringField(2)
+
+
+class BatchGuessForm(messages.Message):
+    """Inbound, used to make several guesses in a game at once"""
+    guesses = messages.MessageField(GuessForm, 1, repeated=True)
+
+
+class GuessResultForm(messages.Message):
+    """Outbound, the result of one guess of a batch of guesses"""
+    letter_guess = messages.StringField(1)
+    word_guess = messages.StringField(2)
+    message = messages.StringField(3)
+    error = messages.BooleanField(4)
+
+
+class BatchGuessResultForm(messages.Message):
+    """Outbound, the results of a batch of guesses and the game state"""
+    results = messages.MessageField(GuessResultForm, 1, repeated=True)
+    state = messages.MessageField(GameStateForm, 2)
+
+
 class GameHistoryForm(messages.Message):
     """Outbound, game history information"""
     guess = messages.StringField(1)
@@ -140,4 +475,6 @@ class GameHistoryForm(messages.Message):
 
 class GameHistoryForms(messages.Message):
     """Outbound, create multiple instances of GameHistoryForm"""
-    history = messages.MessageField(GameHistoryForm, 1, repeated=True)
\ No newline at end of file
+    history = messages.MessageField(GameHistoryForm, 1, repeated=True)
+    etag = messages.StringField(2)
+    not_modified = messages.BooleanField(3, default=False)
\ No newline at end of file
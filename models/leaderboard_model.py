@@ -0,0 +1,216 @@
+import random
+import zlib
+from datetime import date, timedelta
+
+from google.appengine.ext import ndb
+
+from config import (
+    LEADERBOARD_SIZE,
+    LEADERBOARD_SHARDS,
+    DAILY_LEADERBOARD_DAYS,
+    WEEKLY_LEADERBOARD_WEEKS,
+)
+from models.counter_model import UserScoreShard
+from models.score_model import ScoreForm
+from models.user_model import RankingForm
+
+HIGH_SCORES = 'high_scores'
+USER_RANKINGS = 'user_rankings'
+
+# Periods of the time bucketed high scores leaderboards
+DAY = 'day'
+WEEK = 'week'
+PERIODS = (DAY, WEEK)
+
+
+def period_board(period, day):
+    """Returns the name of the high scores leaderboard of the day or ISO week
+    containing a date, e.g. high_scores:day:2016-10-18 or
+    high_scores:week:2016-W42"""
+    if period == DAY:
+        return '{}:{}:{}'.format(HIGH_SCORES, DAY, day.isoformat())
+    year, week, _ = day.isocalendar()
+    return '{}:{}:{}-W{:02d}'.format(HIGH_SCORES, WEEK, year, week)
+
+
+def period_expires(period, day):
+    """Returns the date from which the high scores leaderboard of the day or
+    ISO week containing a date is expired"""
+    if period == DAY:
+        return day + timedelta(days=DAILY_LEADERBOARD_DAYS)
+    monday = day - timedelta(days=day.weekday())
+    return monday + timedelta(weeks=WEEKLY_LEADERBOARD_WEEKS)
+
+
+class LeaderboardEntry(ndb.Model):
+    """A single entry of a leaderboard"""
+    user_name = ndb.StringProperty(required=True)
+    score     = ndb.IntegerProperty(required=True)
+    date      = ndb.DateProperty()
+    won       = ndb.BooleanProperty()
+    score_key = ndb.KeyProperty(kind='Score')
+
+    def create_score_form(self):
+        """Creates and returns a ScoreForm"""
+        return ScoreForm(user_name=self.user_name,
+                         won=self.won,
+                         date=str(self.date),
+                         score=self.score)
+
+    def create_ranking_form(self):
+        """Creates and returns a RankingForm"""
+        return RankingForm(user_name=self.user_name,
+                           score=self.score)
+
+
+class Leaderboard(ndb.Model):
+    """One shard of a leaderboard, the entries are sorted by score. The
+    shards of a day's or week's high scores expire. built is set by
+    rebuild, on the shards of a leaderboard that holds its top entries"""
+    entries = ndb.LocalStructuredProperty(LeaderboardEntry, repeated=True)
+    expires = ndb.DateProperty()
+    built   = ndb.BooleanProperty(default=False, indexed=False)
+
+    @staticmethod
+    def shard_key(board, shard):
+        """Returns the key of a leaderboard shard"""
+        return ndb.Key(Leaderboard, '{}-{}'.format(board, shard))
+
+    @classmethod
+    def shard_keys(cls, board):
+        """Returns the keys of all the shards of a leaderboard"""
+        return [cls.shard_key(board, shard)
+                for shard in range(LEADERBOARD_SHARDS)]
+
+    @staticmethod
+    def entry_shard(board, entry):
+        """Returns the shard of a leaderboard an entry goes to. A user is
+        always kept on the same rankings shard, and a Score on the same high
+        scores shard, where they are found if they were already added"""
+        if board == USER_RANKINGS:
+            value = zlib.crc32(entry.user_name.encode('utf-8'))
+        elif entry.score_key:
+            value = zlib.crc32(entry.score_key.urlsafe())
+        else:
+            return random.randint(0, LEADERBOARD_SHARDS - 1)
+        return value % LEADERBOARD_SHARDS
+
+    @classmethod
+    def get_top(cls, board, number_of_results=LEADERBOARD_SIZE,
+                built_only=False):
+        """Returns the top entries of a leaderboard, or None if it has no
+        shards yet. With built_only, also None unless every shard was written
+        by rebuild, for leaderboards that only hold the scores added since
+        they were created until they are rebuilt"""
+        shards = ndb.get_multi(cls.shard_keys(board))
+        if built_only and not all(shard and shard.built for shard in shards):
+            return None
+        shards = [shard for shard in shards if shard]
+        if not shards:
+            return None
+        entries = [entry for shard in shards for entry in shard.entries]
+        entries.sort(key=lambda entry: entry.score, reverse=True)
+        return entries[:number_of_results]
+
+    @classmethod
+    def add_win(cls, score_key):
+        """Add a won game's Score to the high scores leaderboards and set its
+        user's total on the rankings and as the user's ranking_score, in one
+        transaction. The total is read from the score counter's shards in the
+        transaction, so concurrent wins of a user can't overwrite it with a
+        stale total. Safe to run again"""
+        score = score_key.get()
+        if not score:
+            return
+
+        @ndb.transactional_tasklet(xg=True)
+        def add():
+            user, shards = yield (
+                score.user.get_async(),
+                ndb.get_multi_async(UserScoreShard.shard_keys(score.user)))
+            futures = [cls.add_score_async(user_name=score.user_name,
+                                           score=score.score,
+                                           date=score.date,
+                                           won=score.won,
+                                           score_key=score_key)]
+            if user:
+                total = user.score + sum(shard.count for shard in shards
+                                         if shard)
+                futures.append(cls.set_user_score_async(user.user_name,
+                                                        total))
+                if user.ranking_score != total:
+                    user.ranking_score = total
+                    futures.append(user.put_async())
+            yield futures
+
+        add().get_result()
+
+    @classmethod
+    @ndb.tasklet
+    def add_score_async(cls, user_name, score, date, won, score_key=None):
+        """Add a game score to the all time high scores leaderboard and to
+        those of its day and week. Must be called inside a transaction"""
+        boards = [(HIGH_SCORES, None)]
+        boards.extend((period_board(period, date), period_expires(period, date))
+                      for period in PERIODS)
+        entry = LeaderboardEntry(user_name=user_name, score=score, date=date,
+                                 won=won, score_key=score_key)
+        shard = cls.entry_shard(HIGH_SCORES, entry)
+        yield [cls._add_entry_async(cls.shard_key(board, shard), entry,
+                                    expires=expires)
+               for board, expires in boards]
+
+    @classmethod
+    def set_user_score_async(cls, user_name, score):
+        """Set the total score of a user on the user rankings leaderboard.
+        Must be called inside a transaction"""
+        entry = LeaderboardEntry(user_name=user_name, score=score)
+        shard = cls.entry_shard(USER_RANKINGS, entry)
+        return cls._add_entry_async(cls.shard_key(USER_RANKINGS, shard), entry,
+                                    replace=True)
+
+    @classmethod
+    @ndb.tasklet
+    def _add_entry_async(cls, key, entry, replace=False, expires=None):
+        """Insert an entry into a shard, keeping it bounded and sorted. An
+        entry of a Score already on the shard is skipped"""
+        shard = yield key.get_async()
+        shard = shard or cls(key=key, expires=expires)
+        entries = shard.entries
+        if replace:
+            entries = [e for e in entries if e.user_name != entry.user_name]
+
+        elif entry.score_key and any(e.score_key == entry.score_key
+                                     for e in entries):
+            raise ndb.Return()
+
+        elif (len(entries) >= LEADERBOARD_SIZE and
+                entry.score <= entries[-1].score):
+            raise ndb.Return()
+
+        entries.append(entry)
+        entries.sort(key=lambda e: e.score, reverse=True)
+        shard.entries = entries[:LEADERBOARD_SIZE]
+        yield shard.put_async()
+
+    @classmethod
+    def expired_keys(cls, today, limit, cursor=None):
+        """Returns a page of the keys of the expired leaderboard shards, the
+        next cursor and whether there are more. The all time leaderboards
+        have no expires date, which sorts before every date, so the range is
+        bounded from below"""
+        return cls.query(cls.expires >= date.min,
+                         cls.expires <= today).fetch_page(
+            limit, start_cursor=cursor, keys_only=True)
+
+    @classmethod
+    def rebuild(cls, board, entries):
+        """Replace a leaderboard with the given entries, each on the shard
+        that adding it would have used"""
+        shards = [cls(key=key, built=True) for key in cls.shard_keys(board)]
+        for entry in entries:
+            shards[cls.entry_shard(board, entry)].entries.append(entry)
+        for shard in shards:
+            shard.entries.sort(key=lambda e: e.score, reverse=True)
+            del shard.entries[LEADERBOARD_SIZE:]
+        ndb.put_multi(shards)
@@ -7,18 +7,46 @@ from google.appengine.ext import ndb
 
 class Score(ndb.Model):
     """Score Object"""
-    user    = ndb.KeyProperty(required=True, kind='User')
-    date    = ndb.DateProperty(required=True)
-    won     = ndb.BooleanProperty(required=True)
-    score   = ndb.IntegerProperty(required=True)
+    user      = ndb.KeyProperty(required=True, kind='User')
+    user_name = ndb.StringProperty()
+    date      = ndb.DateProperty(required=True)
+    won       = ndb.BooleanProperty(required=True)
+    score     = ndb.IntegerProperty(required=True)
 
-    def create_form(self):
+    # Properties fetched by projection listing queries
+    LISTING_PROJECTION = ('user_name', 'date', 'won', 'score')
+
+    def create_form(self, user_name=None):
         """Creates and returns a ScoreForm"""
-        return ScoreForm(user_name=self.user.get().user_name,
+        if user_name is None:
+            user_name = self.user_name or self.user.get().user_name
+        return ScoreForm(user_name=user_name,
                          won=self.won,
                          date=str(self.date),
                          score=self.score)
 
+    @classmethod
+    def create_forms(cls, scores, next_cursor=None):
+        """Creates and returns a ScoreForms for a list of scores.
+
+        Scores written before user_name was copied onto them are resolved
+        with a single get_multi for all of their distinct users.
+        """
+        scores = list(scores)
+        missing = list(set(score.user for score in scores
+                           if not score.user_name))
+        names = {}
+        if missing:
+            for key, user in zip(missing, ndb.get_multi(missing)):
+                if user:
+                    names[key] = user.user_name
+
+        items = []
+        for score in scores:
+            user_name = score.user_name or names.get(score.user, '')
+            items.append(score.create_form(user_name=user_name))
+        return ScoreForms(items=items, next_cursor=next_cursor)
+
 
 class ScoreForm(messages.Message):
     """Outbound, score information"""
@@ -30,4 +58,7 @@ class ScoreForm(messages.Message):
 
 class ScoreForms(messages.Message):
     """Outbound, create multiple instances of ScoreForm"""
-    items=messages.MessageField(ScoreForm, 1, repeated=True)
\ No newline at end of file
+    items=messages.MessageField(ScoreForm, 1, repeated=True)
+    next_cursor = messages.StringField(2)
+    etag = messages.StringField(3)
+    not_modified = messages.BooleanField(4, default=False)
\ No newline at end of file
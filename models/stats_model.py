@@ -0,0 +1,146 @@
+from protorpc import messages
+from google.appengine.ext import ndb
+
+
+class UserStats(ndb.Model):
+    """Running totals of a user's finished games.
+
+    Stats are root entities keyed by the user's key id, so they can be read
+    with one get from the user name and their updates don't contend with the
+    User entity. end_game and cancel_game update them in the transaction that
+    saves the game, the rebuild_user_stats migration recomputes them from the
+    user's games. While a rebuild is running, rebuild_games holds the games
+    added since it started, which the rebuild leaves to these updates.
+    """
+    # The totals, which rebuilds and moves add up
+    COUNTS = ('games_won', 'games_lost', 'games_cancelled', 'total_score',
+              'total_guesses')
+
+    user_name       = ndb.StringProperty(indexed=False)
+    games_won       = ndb.IntegerProperty(default=0, indexed=False)
+    games_lost      = ndb.IntegerProperty(default=0, indexed=False)
+    games_cancelled = ndb.IntegerProperty(default=0, indexed=False)
+    total_score     = ndb.IntegerProperty(default=0, indexed=False)
+    total_guesses   = ndb.IntegerProperty(default=0, indexed=False)
+    rebuilding      = ndb.BooleanProperty(default=False, indexed=False)
+    rebuild_games   = ndb.KeyProperty(kind='Game', repeated=True,
+                                      indexed=False)
+
+    @classmethod
+    def key_for(cls, user_key):
+        """Returns the key of a user's stats"""
+        return ndb.Key(cls, user_key.id())
+
+    def add_game(self, game, won=False):
+        """Add a finished or cancelled game to the totals"""
+        if game.game_cancelled:
+            self.games_cancelled += 1
+            return
+        if won:
+            self.games_won += 1
+            self.total_score += game.score
+        else:
+            self.games_lost += 1
+        self.total_guesses += game.guess_count()
+
+    @classmethod
+    @ndb.tasklet
+    def add_game_async(cls, user_name, game, won=False):
+        """Add a game to its user's stats. Must be called inside the
+        transaction that saves the game"""
+        key = cls.key_for(game.user)
+        stats = yield key.get_async()
+        stats = stats or cls(key=key)
+        stats.user_name = user_name
+        stats.add_game(game, won)
+        if stats.rebuilding:
+            stats.rebuild_games.append(game.key)
+        yield stats.put_async()
+
+    def add_counts(self, other, sign=1):
+        """Add, or with a sign of -1 subtract, another stats' totals"""
+        for name in self.COUNTS:
+            setattr(self, name,
+                    getattr(self, name) + sign * getattr(other, name))
+
+    @classmethod
+    @ndb.transactional(xg=True)
+    def move(cls, old_user_key, new_user_key):
+        """Add a user's stats to the stats of a new user key, which games
+        that already moved may have started, and delete them, in one
+        transaction"""
+        stats, moved = ndb.get_multi([cls.key_for(old_user_key),
+                                      cls.key_for(new_user_key)])
+        if not stats:
+            return
+        moved = moved or cls(key=cls.key_for(new_user_key))
+        moved.user_name = stats.user_name
+        moved.add_counts(stats)
+        moved.put()
+        stats.key.delete()
+
+    @staticmethod
+    @ndb.transactional(xg=True)
+    def start_rebuild(user_key, user_name):
+        """Start rebuilding a user's stats, in one transaction. Returns the
+        UserStatsRebuild the games are counted into, which starts at minus
+        the current totals, so that finishing adds the counted games and
+        the updates made meanwhile"""
+        key = UserStats.key_for(user_key)
+        stats = key.get() or UserStats(key=key)
+        stats.user_name = user_name
+        stats.rebuilding = True
+        stats.rebuild_games = []
+        rebuild = UserStatsRebuild(key=UserStatsRebuild.key_for(user_key))
+        rebuild.add_counts(stats, sign=-1)
+        ndb.put_multi([stats, rebuild])
+        return rebuild
+
+    @staticmethod
+    @ndb.transactional(xg=True)
+    def finish_rebuild(rebuild):
+        """Add a finished rebuild to the user's stats and delete it, in one
+        transaction"""
+        key = ndb.Key(UserStats, rebuild.key.id())
+        stats = key.get() or UserStats(key=key)
+        stats.add_counts(rebuild)
+        stats.rebuilding = False
+        stats.rebuild_games = []
+        stats.put()
+        rebuild.key.delete()
+
+    def create_form(self):
+        """Creates and returns a UserStatsForm"""
+        games_played = self.games_won + self.games_lost
+        form = UserStatsForm(user_name=self.user_name,
+                             games_played=games_played,
+                             games_won=self.games_won,
+                             games_lost=self.games_lost,
+                             games_cancelled=self.games_cancelled,
+                             total_score=self.total_score)
+        if games_played:
+            form.win_rate = self.games_won / float(games_played)
+            form.average_score = self.total_score / float(games_played)
+            form.average_guesses = self.total_guesses / float(games_played)
+        return form
+
+
+class UserStatsRebuild(UserStats):
+    """The progress of the rebuild_user_stats migration through one user's
+    games: the totals counted so far, less the user's totals when it
+    started, and where it is up to"""
+    phase  = ndb.StringProperty(default='games', indexed=False)
+    cursor = ndb.StringProperty(indexed=False)
+
+
+class UserStatsForm(messages.Message):
+    """Outbound, a user's game statistics"""
+    user_name = messages.StringField(1, required=True)
+    games_played = messages.IntegerField(2, required=True)
+    games_won = messages.IntegerField(3, required=True)
+    games_lost = messages.IntegerField(4, required=True)
+    games_cancelled = messages.IntegerField(5, required=True)
+    total_score = messages.IntegerField(6, required=True)
+    win_rate = messages.FloatField(7, default=0.0)
+    average_score = messages.FloatField(8, default=0.0)
+    average_guesses = messages.FloatField(9, default=0.0)
@@ -2,33 +2,118 @@ import endpoints
 from protorpc import messages
 from google.appengine.ext import ndb
 
+from config import LEGACY_USER_LOOKUP
+from models.counter_model import UserScoreShard
+
 
 class User(ndb.Model):
-    """A User Profile object"""
-    user_name = ndb.StringProperty(required=True)
-    email     = ndb.StringProperty()
-    score     = ndb.IntegerProperty(default=0)
+    """A User Profile object.
+
+    Users are keyed by their normalized user name, see key_for. Users
+    created before that have numeric ids until the rekey_users migration
+    has moved them. While config.LEGACY_USER_LOOKUP is set they are found
+    with a query.
+
+    A user's total score is score, the total from before score counters were
+    added which is no longer updated, plus the UserScoreShard counter.
+    ranking_score is a copy of the total used to order the rankings query.
+    It is set by the leaderboard task of each win and synced periodically.
+    """
+    user_name     = ndb.StringProperty(required=True)
+    email         = ndb.StringProperty()
+    score         = ndb.IntegerProperty(default=0, indexed=False)
+    ranking_score = ndb.IntegerProperty()
+    # Finds the legacy users whose name is taken by a new user's key
+    normalized_name = ndb.ComputedProperty(
+        lambda user: User.normalize_name(user.user_name))
+
+    # Properties fetched by the projection rankings query
+    RANKING_PROJECTION = ('user_name', 'ranking_score')
 
+    def total_score(self):
+        """Returns the user's total score"""
+        return self.score + UserScoreShard.get_total(self.key)
 
-    def create_ranking_form(self):
+    @staticmethod
+    def total_scores(users):
+        """Returns a dict of user key to total score for a list of users"""
+        totals = UserScoreShard.get_totals([user.key for user in users])
+        return dict((user.key, user.score + totals[user.key])
+                    for user in users)
+
+    def create_ranking_form(self, total_score=None):
         """Creates and returns a RankingForm"""
+        if total_score is None:
+            total_score = self.total_score()
         return RankingForm(user_name=self.user_name,
-                           score=self.score)
+                           score=total_score)
+
+    @classmethod
+    def create_ranking_forms(cls, users, next_cursor=None):
+        """Creates and returns a RankingForms for a list of users"""
+        totals = cls.total_scores(users)
+        return RankingForms(items=[user.create_ranking_form(totals[user.key])
+                                   for user in users],
+                            next_cursor=next_cursor)
+
+    @staticmethod
+    def create_projected_ranking_forms(users, next_cursor=None):
+        """Creates and returns a RankingForms for users from a projection
+        query, scored by their synced ranking_score"""
+        return RankingForms(items=[RankingForm(user_name=user.user_name,
+                                               score=user.ranking_score)
+                                   for user in users],
+                            next_cursor=next_cursor)
+
+    @staticmethod
+    def normalize_name(user_name):
+        """Returns the form of a user name used as the key id"""
+        return user_name.strip().lower()
+
+    @classmethod
+    def key_for(cls, user_name):
+        """Returns the key of the user with a user name"""
+        return ndb.Key(cls, cls.normalize_name(user_name))
 
     @classmethod
     def create(cls, user_name, email=''):
         """Create a user"""
-        if cls.query(cls.user_name == user_name).get():
-            msg = 'Error, that username already exists'
-            raise endpoints.ConflictException(msg)
-        user = cls(user_name=user_name, email=email)
-        user.put()
-        return user
+        if not cls.normalize_name(user_name):
+            msg = 'Error, a username is required'
+            raise endpoints.BadRequestException(msg)
+
+        msg = 'Error, that username already exists'
+        if LEGACY_USER_LOOKUP:
+            # A legacy user is found by its exact name until reindex_entities
+            # has stored its normalized_name
+            normalized = cls.normalize_name(user_name)
+            futures = [query.get_async(keys_only=True) for query in (
+                cls.query(cls.user_name == user_name),
+                cls.query(cls.normalized_name == normalized))]
+            if any(future.get_result() for future in futures):
+                raise endpoints.ConflictException(msg)
+
+        @ndb.transactional
+        def create_user():
+            key = cls.key_for(user_name)
+            if key.get():
+                raise endpoints.ConflictException(msg)
+            user = cls(key=key, user_name=user_name, email=email,
+                       ranking_score=0)
+            user.put()
+            return user
+        return create_user()
 
     @classmethod
     def get_by_name(cls, user_name):
-        """Get a user"""
-        user = cls.query(cls.user_name == user_name).get()
+        """Get a user. While legacy users are looked up, a user keyed by the
+        normalized name is only returned when no legacy user has exactly
+        this name, for names created before create rejected them"""
+        user = None
+        if cls.normalize_name(user_name):
+            user = cls.key_for(user_name).get()
+        if LEGACY_USER_LOOKUP and (not user or user.user_name != user_name):
+            user = cls.query(cls.user_name == user_name).get() or user
         if not user:
             msg = 'A user with that name does not exist!'
             raise endpoints.NotFoundException(msg)
@@ -44,6 +129,9 @@ class RankingForm(messages.Message):
 class RankingForms(messages.Message):
     """Outbound, create mutiple instances of RankingForm"""
     items = messages.MessageField(RankingForm, 1, repeated=True)
+    next_cursor = messages.StringField(2)
+    etag = messages.StringField(3)
+    not_modified = messages.BooleanField(4, default=False)
 
 
 class UserMessage(messages.Message):
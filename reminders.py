@@ -0,0 +1,90 @@
+"""reminders.py - Reminder emails for users with active games.
+
+The daily cron starts a chain of tasks that each check one page of users
+and queue the next page, so the job is never limited by a single request's
+deadline. Each page's reminders are sent by a separate mail task. A task
+that fails is retried by the task queue and picks up where it left off:
+every reminder sent is recorded in memcache for the day, so a retry doesn't
+email anybody twice.
+"""
+
+import hashlib
+import json
+from datetime import date
+
+from google.appengine.api import mail, app_identity, memcache, taskqueue
+
+from config import REMINDER_BATCH_SIZE
+from utils import fetch_page
+from models.user_model import User
+from models.game_model import Game
+
+QUEUE = 'reminders'
+SENT_SECONDS = 2 * 24 * 60 * 60
+
+
+def _add_task(kind, day, cursor, **kwargs):
+    """Queue a task named after its kind, day and page, so a retried task
+    can't queue the same work twice"""
+    page = hashlib.md5(cursor or '').hexdigest()
+    try:
+        taskqueue.add(url='/tasks/reminders/{}'.format(kind), queue_name=QUEUE,
+                      name='reminders-{}-{}-{}'.format(kind, day, page),
+                      **kwargs)
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        pass
+
+
+def start(day=None):
+    """Queue the first page of the reminders of a day"""
+    day = (day or date.today()).isoformat()
+    _add_task('find', day, None, params={'day': day})
+
+
+def find_recipients(day, cursor=None):
+    """Check one page of users with an email for active games. Queues the
+    next page, then a mail task for the users that have an active game"""
+    # A != filter would be run as several queries, which can't be paged
+    # with a cursor. This range also skips users with an empty email.
+    users, next_cursor = fetch_page(User.query(User.email > ''),
+                                    REMINDER_BATCH_SIZE, cursor)
+    if next_cursor:
+        _add_task('find', day, next_cursor,
+                  params={'day': day, 'cursor': next_cursor})
+
+    # One keys only, limit 1 query per user, all running at once
+    futures = [(user, Game.query_user_games(user.key)
+                          .filter(Game.status_filter(Game.ACTIVE))
+                          .get_async(keys_only=True))
+               for user in users]
+    recipients = [{'user_id': user.key.urlsafe(),
+                   'email': user.email,
+                   'user_name': user.user_name}
+                  for user, future in futures
+                  if user.email and future.get_result()]
+
+    if recipients:
+        _add_task('send', day, cursor,
+                  payload=json.dumps({'day': day, 'recipients': recipients}))
+
+
+def send(day, recipients):
+    """Send the reminders of a mail task, skipping users already reminded
+    that day"""
+    app_id = app_identity.get_application_id()
+    email_from = 'noreply@{}.appspotmail.com'.format(app_id)
+    email_subject = 'Have you given up on your game of Hangman?'
+
+    for recipient in recipients:
+        sent_key = 'reminder:{}:{}'.format(day, recipient['user_id'])
+        if not memcache.add(sent_key, True, time=SENT_SECONDS):
+            continue
+        email_body = (u'Hello {}, it\'s been awhile since you played'
+                      ' your game of hangman. why don\'t you come back'
+                      ' and play for awhile').format(recipient['user_name'])
+        try:
+            mail.send_mail(email_from, recipient['email'], email_subject,
+                           email_body)
+        except Exception:
+            memcache.delete(sent_key)
+            raise
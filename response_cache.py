@@ -0,0 +1,86 @@
+"""response_cache.py - Memcache cache of read only endpoint responses.
+
+Responses are stored as encoded protorpc messages under a key made from a
+scope, the scope's current version and the request parameters. Writes that
+change what a scope returns bump its version with bump, so the old responses
+are never read again and simply expire. A response's ETag is a hash of its
+scope, version and parameters: a client that sends back the ETag it last saw
+as if_none_match gets an empty not_modified response while nothing changed.
+
+A version missing from memcache is restarted from the current time in
+milliseconds, so it can't repeat a version whose responses may still be
+cached.
+"""
+
+import hashlib
+import time
+
+from google.appengine.api import memcache
+from protorpc import protobuf
+
+from config import RESPONSE_CACHE_SECONDS
+
+VERSION_PREFIX = 'response_version:'
+RESPONSE_PREFIX = 'response:'
+
+# Scopes of the cached responses
+SCORES = 'scores'
+RANKINGS = 'rankings'
+
+
+def user_scores_scope(user_name):
+    """Returns the scope of a user's score listing"""
+    name = user_name.strip().lower()
+    if isinstance(name, unicode):
+        # memcache keys are byte strings, and names need not be ASCII
+        name = name.encode('utf-8')
+    return 'user_scores:{}'.format(name)
+
+
+def get_version(scope):
+    """Returns the current version of a scope"""
+    version = memcache.get(VERSION_PREFIX + scope)
+    if version is None:
+        version = int(time.time() * 1000)
+        if not memcache.add(VERSION_PREFIX + scope, version):
+            version = memcache.get(VERSION_PREFIX + scope) or version
+    return version
+
+
+def bump(*scopes):
+    """Move scopes to a new version, after a write that changes them"""
+    for scope in scopes:
+        memcache.incr(VERSION_PREFIX + scope)
+
+
+def make_etag(scope, version, params):
+    """Returns the ETag of a response"""
+    return hashlib.md5(repr((scope, version, params))).hexdigest()
+
+
+def get_or_build(scope, params, message_type, build, if_none_match=None):
+    """Returns a cached response, building and caching it on a miss.
+    Args:
+        scope: The scope of the response, see bump
+        params: A tuple of the request parameters the response depends on
+        message_type: The protorpc message class of the response, it must
+            have etag and not_modified fields
+        build: A function returning the response
+        if_none_match: The ETag the client already has
+    Returns:
+        The response with its etag set, or an empty not_modified response if
+        it has the ETag in if_none_match."""
+    etag = make_etag(scope, get_version(scope), params)
+    if if_none_match == etag:
+        return message_type(etag=etag, not_modified=True)
+
+    data = memcache.get(RESPONSE_PREFIX + etag)
+    if data is not None:
+        message = protobuf.decode_message(message_type, data)
+    else:
+        message = build()
+        message.etag = etag
+        memcache.set(RESPONSE_PREFIX + etag,
+                     protobuf.encode_message(message),
+                     time=RESPONSE_CACHE_SECONDS)
+    return message
@@ -0,0 +1,205 @@
+"""simulator.py - Self-play simulator of the rules in game_engine.
+
+Plays games with a guessing strategy across a pool of processes, using the
+same rules and scoring as the API but no datastore, and prints the score
+distribution, the win rate and the games played per second. Useful to see
+how the scoring constants and misses_allowed play out before changing them:
+
+    python simulator.py --games 1000000 --strategy frequency --misses 5
+    python simulator.py --strategy hint --hint-penalty 10 --word-point 40
+
+A strategy is a class with a next_moves(state, rng) method returning a list
+of game_engine moves and their arguments, registered in STRATEGIES.
+"""
+
+import argparse
+import collections
+import multiprocessing
+import random
+import string
+import time
+
+import game_engine
+from hint_engine import HintIndex
+from history_codec import mask_letters
+from word_source import WordSource, get_word_source
+
+LETTER_ORDER = 'ETAOINSHRDLUCMFWYPVBGKJQXZ'
+
+# Games per task sent to a worker process
+CHUNK_SIZE = 1000
+
+
+class RandomStrategy(object):
+    """Guesses letters it hasn't tried at random"""
+
+    def __init__(self, source):
+        self.source = source
+
+    def next_moves(self, state, rng):
+        guessed = set(mask_letters(state.guessed))
+        letter = rng.choice([l for l in string.ascii_uppercase
+                             if l not in guessed])
+        return [(game_engine.guess_letter, letter)]
+
+
+class FrequencyStrategy(RandomStrategy):
+    """Guesses letters in order of their frequency in English"""
+
+    def next_moves(self, state, rng):
+        for letter in LETTER_ORDER:
+            if not state.guessed & (1 << (ord(letter) - ord('A'))):
+                return [(game_engine.guess_letter, letter)]
+
+
+class HintStrategy(FrequencyStrategy):
+    """Asks for a hint before every guess and guesses the suggested letter,
+    paying the hint penalty like the get_hint endpoint. Falls back to the
+    frequency order when no dictionary word matches"""
+
+    def __init__(self, source):
+        super(HintStrategy, self).__init__(source)
+        self.index = HintIndex(source)
+
+    def next_moves(self, state, rng):
+        letter, _ = self.index.suggest(state.solution,
+                                       mask_letters(state.guessed))
+        if letter:
+            return [(game_engine.hint, letter),
+                    (game_engine.guess_letter, letter)]
+        return super(HintStrategy, self).next_moves(state, rng)
+
+
+STRATEGIES = {
+    'random': RandomStrategy,
+    'frequency': FrequencyStrategy,
+    'hint': HintStrategy,
+}
+
+# Set in each worker process by init_worker
+_worker = {}
+
+
+def init_worker(options):
+    """Load the word source and strategy of a worker process"""
+    if options['words']:
+        source = WordSource.from_file(options['words'])
+    else:
+        source = get_word_source()
+    _worker['source'] = source
+    _worker['strategy'] = STRATEGIES[options['strategy']](source)
+    _worker['options'] = options
+
+
+def play_game(word, misses, strategy, scoring, rng):
+    """Play one game to its end. Returns the final GameState"""
+    state = game_engine.GameState(word, misses)
+    while not state.over:
+        for move, argument in strategy.next_moves(state, rng):
+            move(state, argument, scoring)
+    return state
+
+
+def play_chunk(task):
+    """Play a chunk of games in a worker. Returns a Counter of final scores
+    and the number of games won"""
+    seed, count = task
+    options = _worker['options']
+    rng = random.Random(seed)
+    random.seed(seed)
+    scores = collections.Counter()
+    wins = 0
+    for _ in range(count):
+        word = _worker['source'].choose(options['length'],
+                                        options['difficulty'])
+        state = play_game(word, options['misses'], _worker['strategy'],
+                          options['scoring'], rng)
+        scores[state.score] += 1
+        wins += state.won
+    return scores, wins
+
+
+def percentile(scores, games, fraction):
+    """Returns the score at a fraction of a Counter of scores"""
+    seen = 0
+    for score in sorted(scores):
+        seen += scores[score]
+        if seen >= fraction * games:
+            return score
+
+
+def report(scores, wins, games, seconds, bucket):
+    """Print the results of a simulation"""
+    print('games        {}'.format(games))
+    print('win rate     {:.2%}'.format(float(wins) / games))
+    print('mean score   {:.1f}'.format(
+        float(sum(score * n for score, n in scores.items())) / games))
+    print('percentiles  p10 {}  p50 {}  p90 {}  max {}'.format(
+        percentile(scores, games, 0.1), percentile(scores, games, 0.5),
+        percentile(scores, games, 0.9), max(scores)))
+    print('games/sec    {:.0f}'.format(games / seconds))
+    print('')
+
+    buckets = collections.Counter()
+    for score, n in scores.items():
+        buckets[score // bucket * bucket] += n
+    largest = max(buckets.values())
+    for start in sorted(buckets):
+        print('{:5}-{:<5} {:7.2%} {}'.format(
+            start, start + bucket - 1, float(buckets[start]) / games,
+            '#' * int(50.0 * buckets[start] / largest)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--games', type=int, default=100000)
+    parser.add_argument('--strategy', choices=sorted(STRATEGIES),
+                        default='frequency')
+    parser.add_argument('--processes', type=int,
+                        default=multiprocessing.cpu_count())
+    parser.add_argument('--misses', type=int, default=5,
+                        help='misses allowed per game')
+    parser.add_argument('--length', type=int, help='secret word length')
+    parser.add_argument('--difficulty', help='secret word difficulty')
+    parser.add_argument('--words', help='word file, default WORDS_FILE')
+    parser.add_argument('--letter-point', type=int,
+                        default=game_engine.DEFAULT_SCORING.letter)
+    parser.add_argument('--word-point', type=int,
+                        default=game_engine.DEFAULT_SCORING.word)
+    parser.add_argument('--blank-point', type=int,
+                        default=game_engine.DEFAULT_SCORING.blank)
+    parser.add_argument('--hint-penalty', type=int,
+                        default=game_engine.DEFAULT_SCORING.hint)
+    parser.add_argument('--bucket', type=int, default=10,
+                        help='width of the score histogram buckets')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    options = {
+        'strategy': args.strategy,
+        'misses': args.misses,
+        'length': args.length,
+        'difficulty': args.difficulty,
+        'words': args.words,
+        'scoring': game_engine.DEFAULT_SCORING._replace(
+            letter=args.letter_point, word=args.word_point,
+            blank=args.blank_point, hint=args.hint_penalty),
+    }
+    tasks = [(args.seed * 1000003 + number, min(CHUNK_SIZE, args.games - start))
+             for number, start in enumerate(range(0, args.games, CHUNK_SIZE))]
+
+    start = time.time()
+    pool = multiprocessing.Pool(args.processes, init_worker, (options,))
+    scores = collections.Counter()
+    wins = 0
+    try:
+        for chunk_scores, chunk_wins in pool.imap_unordered(play_chunk, tasks):
+            scores.update(chunk_scores)
+            wins += chunk_wins
+    finally:
+        pool.terminate()
+    report(scores, wins, args.games, time.time() - start, args.bucket)
+
+
+if __name__ == '__main__':
+    main()
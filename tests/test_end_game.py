@@ -0,0 +1,67 @@
+"""test_end_game.py - Ending a game through the games controller on the
+testbed. Run from the repository root:
+    GAE_SDK=/path/to/google_appengine python -m unittest discover tests
+"""
+
+import unittest
+
+from benchmarks.sdk import setup_sdk, start_testbed
+
+setup_sdk()
+
+import game_engine
+import controllers.games_controller as games_ctrl
+import controllers.scores_controller as scores_ctrl
+from models.counter_model import UserScoreShard
+from models.game_model import Game
+from models.score_model import Score
+from models.user_model import User
+
+
+class EndGameTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bed = start_testbed()
+        self.user = User.create('alice')
+        self.game = Game.create_game(user=self.user.key, misses_allowed=5,
+                                     secret_word='CAT',
+                                     current_solution='___')
+
+    def tearDown(self):
+        self.bed.deactivate()
+
+    def take_hints(self, count):
+        """Take hints on the game, as get_hint does"""
+        state = self.game.engine_state()
+        for _ in range(count):
+            game_engine.hint(state, 'C')
+        self.game.apply_engine_state(state)
+        self.game.save()
+
+    def test_won_game_with_hints_exceeding_points(self):
+        # Cache the user's total, so the win has to update it
+        self.assertEqual(UserScoreShard.get_total(self.user.key), 0)
+        points = game_engine.scored(0, blanks=3, words=1)
+        self.take_hints(points // game_engine.DEFAULT_SCORING.hint + 2)
+
+        form = games_ctrl.guess_word(self.game.key.urlsafe(), 'CAT')
+        self.assertTrue(form.game_over)
+        self.assertLess(form.score, 0)
+        self.assertEqual(UserScoreShard.get_total(self.user.key), form.score)
+        self.assertEqual([score.score for score in Score.query()],
+                         [form.score])
+
+    def test_won_game_of_non_ascii_user_name(self):
+        user = User.create(u'zo\xeb')
+        game = Game.create_game(user=user.key, misses_allowed=5,
+                                secret_word='CAT', current_solution='___')
+        form = games_ctrl.guess_word(game.key.urlsafe(), 'CAT')
+        self.assertTrue(form.game_over)
+        self.assertEqual(
+            [score.user_name
+             for score in scores_ctrl.get_user_scores(u'zo\xeb').items],
+            [u'zo\xeb'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,26 @@
+"""test_hint_engine.py - Hint suggestions over a small word list. Runs
+without the SDK, from the repository root:
+    python -m unittest tests.test_hint_engine
+"""
+
+import unittest
+
+from hint_engine import HintIndex
+from word_source import WordSource
+
+
+class HintIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = HintIndex(WordSource.build('CAT\nCOT\nDOG\nHOUSE\n'))
+
+    def test_suggests_most_common_letter_of_candidates(self):
+        self.assertEqual(self.index.suggest('C__', 'C'), ('T', 2))
+
+    def test_no_words_of_the_pattern_length(self):
+        self.assertEqual(self.index.suggest('____', ''), (None, 0))
+        self.assertEqual(self.index.suggest('A___', 'A'), (None, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+"""test_reminders.py - The reminder task chain against the local taskqueue
+and mail stubs. Run from the repository root:
+    GAE_SDK=/path/to/google_appengine python -m unittest discover tests
+"""
+
+import unittest
+from datetime import date
+
+from benchmarks.sdk import ROOT, setup_sdk
+
+setup_sdk()
+
+import webapp2
+from google.appengine.datastore import datastore_stub_util
+from google.appengine.ext import ndb, testbed
+
+import main
+import reminders
+from models.user_model import User
+from models.game_model import Game
+
+
+class RemindersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bed = testbed.Testbed()
+        self.bed.activate()
+        policy = datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+            probability=1)
+        self.bed.init_datastore_v3_stub(consistency_policy=policy)
+        self.bed.init_memcache_stub()
+        self.bed.init_app_identity_stub()
+        self.bed.init_mail_stub()
+        self.bed.init_taskqueue_stub(root_path=ROOT)
+        ndb.get_context().clear_cache()
+        self.mail_stub = self.bed.get_stub(testbed.MAIL_SERVICE_NAME)
+        self.taskqueue_stub = self.bed.get_stub(
+            testbed.TASKQUEUE_SERVICE_NAME)
+
+        # Small pages, so the chain has to follow its cursors
+        self.batch_size = reminders.REMINDER_BATCH_SIZE
+        reminders.REMINDER_BATCH_SIZE = 2
+
+    def tearDown(self):
+        reminders.REMINDER_BATCH_SIZE = self.batch_size
+        self.bed.deactivate()
+
+    def add_user(self, name, email, game_over=None):
+        """Store a user, with a game unless game_over is None"""
+        user = User(key=User.key_for(name), user_name=name, email=email)
+        user.put()
+        if game_over is not None:
+            Game(parent=user.key, user=user.key, misses_allowed=5,
+                 misses_remaining=5, secret_word='WORD',
+                 current_solution='____', game_over=game_over).put()
+
+    def run_tasks(self):
+        """Run the queued reminder tasks until the chain is done"""
+        done = set()
+        while True:
+            tasks = [task for task in self.taskqueue_stub.get_filtered_tasks(
+                         queue_names=reminders.QUEUE)
+                     if task.name not in done]
+            if not tasks:
+                return
+            for task in tasks:
+                done.add(task.name)
+                request = webapp2.Request.blank(task.url, POST=task.payload,
+                                                headers=task.headers)
+                response = request.get_response(main.app)
+                self.assertEqual(response.status_int, 200, response.body)
+
+    def sent_to(self):
+        """Returns the sorted addresses of the sent emails"""
+        return sorted(message.to
+                      for message in self.mail_stub.get_sent_messages())
+
+    def test_reminds_users_with_active_games(self):
+        for number in range(5):
+            self.add_user('active{}'.format(number),
+                          'active{}@example.com'.format(number),
+                          game_over=False)
+        self.add_user('finished', 'finished@example.com', game_over=True)
+        self.add_user('idle', 'idle@example.com')
+        self.add_user('noemail', None, game_over=False)
+        self.add_user('emptyemail', '', game_over=False)
+        self.add_user(u'zo\xeb', 'zoe@example.com', game_over=False)
+
+        reminders.start()
+        self.run_tasks()
+        self.assertEqual(self.sent_to(),
+                         ['active{}@example.com'.format(number)
+                          for number in range(5)] + ['zoe@example.com'])
+
+    def test_retried_mail_task_sends_once(self):
+        self.add_user('active', 'active@example.com', game_over=False)
+        reminders.start()
+        self.run_tasks()
+        recipient = {'user_id': User.key_for('active').urlsafe(),
+                     'email': 'active@example.com', 'user_name': 'active'}
+        reminders.send(date.today().isoformat(), [recipient])
+        self.assertEqual(self.sent_to(), ['active@example.com'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,24 +1,22 @@
 """utils.py - File for collecting general utility functions."""
 
-import random
+from google.appengine.datastore.datastore_query import Cursor
 from google.appengine.ext import ndb
 import endpoints
 
-def get_by_urlsafe(urlsafe, model):
-    """Returns an ndb.Model entity that the urlsafe key points to. Checks
-        that the type of entity returned is of the correct kind. Raises an
-        error if the key String is malformed or the entity is of the incorrect
-        kind
+from config import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from word_source import get_word_source
+
+def key_from_urlsafe(urlsafe):
+    """Returns the ndb.Key that a urlsafe key string encodes.
     Args:
         urlsafe: A urlsafe key string
-        model: The expected entity kind
     Returns:
-        The entity that the urlsafe Key string points to or None if no entity
-        exists.
+        The decoded ndb.Key
     Raises:
-        ValueError:"""
+        BadRequestException: If the key string is malformed"""
     try:
-        key = ndb.Key(urlsafe=urlsafe)
+        return ndb.Key(urlsafe=urlsafe)
     except TypeError:
         raise endpoints.BadRequestException('Invalid Key')
     except Exception, e:
@@ -27,24 +25,109 @@ def get_by_urlsafe(urlsafe, model):
         else:
             raise
 
-    entity = key.get()
+def keys_from_urlsafe(urlsafes, model):
+    """Decodes a list of urlsafe key strings, checking each is of the
+    correct kind
+    Args:
+        urlsafes: A list of urlsafe key strings
+        model: The expected entity kind
+    Returns:
+        A list of (ndb.Key, error) tuples in the same order, the key is None
+        and error a message for strings that are malformed or of the
+        incorrect kind"""
+    results = []
+    for urlsafe in urlsafes:
+        try:
+            key = key_from_urlsafe(urlsafe)
+        except endpoints.BadRequestException as e:
+            results.append((None, str(e)))
+            continue
+        if key.kind() != model._get_kind():
+            results.append((None, 'Incorrect Kind'))
+        else:
+            results.append((key, None))
+    return results
+
+def get_by_urlsafe(urlsafe, model):
+    """Returns an ndb.Model entity that the urlsafe key points to. Checks
+        that the type of entity returned is of the correct kind. Raises an
+        error if the key String is malformed or the entity is of the incorrect
+        kind
+    Args:
+        urlsafe: A urlsafe key string
+        model: The expected entity kind
+    Returns:
+        The entity that the urlsafe Key string points to or None if no entity
+        exists.
+    Raises:
+        ValueError:"""
+    entity = key_from_urlsafe(urlsafe).get()
     if not entity:
         return None
     if not isinstance(entity, model):
         raise ValueError('Incorrect Kind')
     return entity
 
-def secret_word_generator():
-    """Returns a random word from a list of words"""
-    words = [
-        'APPLE',
-        'TREE',
-        'HOUSE',
-        'GARDEN',
-        'SPECIAL',
-        'FROG',
-        'CHILDREN',
-        'FOOD',
-        'SERVICE',
-        'COMPUTER']
-    return random.choice(words)
\ No newline at end of file
+def clamp_page_size(page_size=None):
+    """Returns the page size to use for a listing request.
+    Args:
+        page_size: The requested page size or None for the default
+    Returns:
+        The page size, capped at MAX_PAGE_SIZE
+    Raises:
+        BadRequestException: If the page size is not positive"""
+    if page_size is None:
+        return DEFAULT_PAGE_SIZE
+    if page_size < 1:
+        raise endpoints.BadRequestException('Error, page_size must be positive')
+    return min(page_size, MAX_PAGE_SIZE)
+
+def fetch_page(query, page_size=None, cursor=None, projection=None):
+    """Fetches one page of results from a query.
+    Args:
+        query: The ndb.Query to fetch from
+        page_size: The number of results wanted, capped at MAX_PAGE_SIZE
+        cursor: A urlsafe cursor string returned by a previous page
+        projection: Property names to fetch with a projection query instead
+            of whole entities
+    Returns:
+        A tuple of the list of results and the urlsafe cursor of the next
+        page, or None if there are no more results.
+    Raises:
+        BadRequestException: If the page size or cursor is invalid"""
+    page_size = clamp_page_size(page_size)
+    try:
+        start_cursor = Cursor(urlsafe=cursor) if cursor else None
+    except Exception:
+        raise endpoints.BadRequestException('Invalid Cursor')
+
+    results, next_cursor, more = query.fetch_page(page_size,
+                                                  start_cursor=start_cursor,
+                                                  projection=projection)
+    if more and next_cursor:
+        return results, next_cursor.urlsafe()
+    return results, None
+
+def first_page_keys(query, page_size=None):
+    """Returns the keys of the first page of a query and the cursor after it,
+    fetching only keys, for a first page that may be served from elsewhere.
+    Args:
+        query: The ndb.Query the later pages are fetched from
+        page_size: The size of the first page, capped at MAX_PAGE_SIZE
+    Returns:
+        A tuple of the list of keys and the urlsafe cursor of the next page,
+        or None if there are no more results"""
+    keys, next_cursor, more = query.fetch_page(clamp_page_size(page_size),
+                                               keys_only=True)
+    if more and next_cursor:
+        return keys, next_cursor.urlsafe()
+    return keys, None
+
+def secret_word_generator(word_length=None, difficulty=None):
+    """Returns a random word from the word source
+    Args:
+        word_length: Only choose words of this length
+        difficulty: Only choose words of this difficulty
+    Raises:
+        LookupError: If no word matches"""
+    return get_word_source().choose(word_length, difficulty)
\ No newline at end of file
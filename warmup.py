@@ -0,0 +1,53 @@
+"""warmup.py - Handler for App Engine warmup requests.
+
+Warmup requests are sent to a new instance before it serves traffic (see
+inbound_services in app.yaml). The handler imports the endpoints API, loads
+the word source and fills the in-process caches, so none of that is paid
+for by the first user request on the instance.
+"""
+
+import logging
+import time
+
+import webapp2
+
+
+def warm_up():
+    """Import the API and prime the instance's caches. Returns a dict of
+    the seconds each step took"""
+    timings = {}
+
+    start = time.time()
+    import api
+    timings['import_api'] = time.time() - start
+
+    start = time.time()
+    from word_source import get_word_source, DIFFICULTIES
+    source = get_word_source()
+    for difficulty in (None,) + DIFFICULTIES:
+        try:
+            source.choose(difficulty=difficulty)
+        except LookupError:
+            pass
+    timings['word_source'] = time.time() - start
+
+    # Fill the cached responses of the most polled listings and load the
+    # leaderboard and ranking code paths
+    start = time.time()
+    import controllers.scores_controller as scores_ctrl
+    import controllers.users_controller as users_ctrl
+    scores_ctrl.get_high_scores(None)
+    users_ctrl.get_user_rankings()
+    timings['listings'] = time.time() - start
+    return timings
+
+
+class WarmupHandler(webapp2.RequestHandler):
+    def get(self):
+        """Warm up a new instance"""
+        logging.info('warmup %s', warm_up())
+
+
+app = webapp2.WSGIApplication([
+    ('/_ah/warmup', WarmupHandler),
+])
@@ -0,0 +1,153 @@
+"""word_source.py - Random secret words from a large word file.
+
+The word file is read once per instance into a single string. Words are
+found through an array of their offsets, and the word numbers of each
+(length, difficulty) bucket are kept in arrays, so a dictionary of hundreds
+of thousands of words costs a few bytes per word instead of a str object
+each. Choosing a random word only looks at the handful of buckets that match.
+The index can be written next to the word file ahead of deployment, so an
+instance only has to read it instead of scanning every word at startup.
+
+A word's difficulty depends on how many of its distinct letters are outside
+the most common letters of English.
+"""
+
+import array
+import cPickle as pickle
+import os
+import random
+import re
+import threading
+import zlib
+
+from config import WORDS_FILE
+
+DIFFICULTIES = ('easy', 'medium', 'hard')
+COMMON_LETTERS = frozenset('ETAOINSHRDLU')
+
+INDEX_SUFFIX = '.idx'
+WORD_RE = re.compile(r'^[A-Z]+$', re.MULTILINE)
+
+_lock = threading.Lock()
+_source = None
+
+
+def word_difficulty(word):
+    """Returns the difficulty of an uppercase word"""
+    uncommon = len(set(word) - COMMON_LETTERS)
+    return DIFFICULTIES[min(uncommon, len(DIFFICULTIES) - 1)]
+
+
+class WordSource(object):
+    """An indexed list of words"""
+
+    def __init__(self, data, offsets, buckets):
+        """Create a word source from a newline separated string of words, the
+        array of the offsets of its words and a dict of (length, difficulty)
+        to the array of the word numbers of that bucket"""
+        self.data = data
+        self.offsets = offsets
+        self.buckets = buckets
+        self._selections = {}
+
+    @classmethod
+    def build(cls, data):
+        """Index the words of a newline separated string, lines that are not
+        a single word of letters from A-Z are skipped"""
+        offsets = array.array('I')
+        buckets = {}
+        for match in WORD_RE.finditer(data):
+            word = match.group()
+            buckets.setdefault((len(word), word_difficulty(word)),
+                               array.array('I')).append(len(offsets))
+            offsets.append(match.start())
+        return cls(data, offsets, buckets)
+
+    @classmethod
+    def from_file(cls, path):
+        """Load a word file, one word per line. The index is read from the
+        file written by save_index if there is one that matches the words,
+        otherwise it is built"""
+        with open(path) as words_file:
+            data = words_file.read().upper().replace('\r', '')
+
+        index_path = path + INDEX_SUFFIX
+        if os.path.exists(index_path):
+            with open(index_path, 'rb') as index_file:
+                index = pickle.load(index_file)
+            if index['crc'] == zlib.crc32(data):
+                offsets = array.array('I')
+                offsets.fromstring(index['offsets'])
+                buckets = {}
+                for bucket, numbers in index['buckets'].items():
+                    buckets[bucket] = array.array('I')
+                    buckets[bucket].fromstring(numbers)
+                return cls(data, offsets, buckets)
+        return cls.build(data)
+
+    def save_index(self, path):
+        """Write the index of the words so from_file doesn't rebuild it"""
+        index = {
+            'crc': zlib.crc32(self.data),
+            'offsets': self.offsets.tostring(),
+            'buckets': dict((bucket, numbers.tostring())
+                            for bucket, numbers in self.buckets.items()),
+        }
+        with open(path + INDEX_SUFFIX, 'wb') as index_file:
+            pickle.dump(index, index_file, pickle.HIGHEST_PROTOCOL)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def word(self, number):
+        """Returns a word by its number"""
+        start = self.offsets[number]
+        end = self.data.find('\n', start)
+        return self.data[start:end if end != -1 else len(self.data)]
+
+    def _selection(self, length, difficulty):
+        """Returns the buckets matching a length and difficulty and the total
+        number of words in them"""
+        selection = self._selections.get((length, difficulty))
+        if selection is None:
+            buckets = [numbers for (bucket_length, bucket_difficulty), numbers
+                       in self.buckets.items()
+                       if length in (None, bucket_length) and
+                       difficulty in (None, bucket_difficulty)]
+            selection = (buckets, sum(len(numbers) for numbers in buckets))
+            self._selections[(length, difficulty)] = selection
+        return selection
+
+    def choose(self, length=None, difficulty=None):
+        """Returns a random word.
+        Args:
+            length: Only choose words of this length
+            difficulty: Only choose words of this difficulty
+        Raises:
+            LookupError: If no word matches"""
+        buckets, total = self._selection(length, difficulty)
+        if not total:
+            raise LookupError('No words match')
+        choice = random.randrange(total)
+        for numbers in buckets:
+            if choice < len(numbers):
+                return self.word(numbers[choice])
+            choice -= len(numbers)
+
+
+def get_word_source():
+    """Returns the instance's WordSource, loading it on first use"""
+    global _source
+    if _source is None:
+        with _lock:
+            if _source is None:
+                path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                    WORDS_FILE)
+                _source = WordSource.from_file(path)
+    return _source
+
+
+if __name__ == '__main__':
+    # Write the index of a word file: python word_source.py words/words.txt
+    import sys
+    WordSource.from_file(sys.argv[1]).save_index(sys.argv[1])